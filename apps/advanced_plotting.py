@@ -125,7 +125,7 @@ def main():
 						
 						else:
 							df_plot = _analysis.dtm_weight_pl(df)
-							df_plot = _analysis.boxplots_pl(df_plot, box_vals, grp_a = grpa_list, grp_b = grpb_list)
+							df_plot = _analysis.boxplots_pl(df_plot, box_vals, st.session_state[user_session_id]["target"]["docs"], grp_a = grpa_list, grp_b = grpb_list)
 
 							plot = alt.Chart(df_plot.to_pandas()).mark_boxplot(ticks=True).encode(
 								alt.X('RF', title='Frequency (per 100 tokens)'),
@@ -174,7 +174,7 @@ def main():
 				
 				elif len(box_vals) > 0:
 					df_plot = _analysis.dtm_weight_pl(df)
-					df_plot = _analysis.boxplots_pl(df_plot, box_vals, grp_a = None, grp_b = None)
+					df_plot = _analysis.boxplots_pl(df_plot, box_vals, st.session_state[user_session_id]["target"]["docs"], grp_a = None, grp_b = None)
 						
 					base = alt.Chart(df_plot.to_pandas()).mark_boxplot(ticks=True).encode(
 						alt.Color(scale=alt.Scale(scheme='category10')),
@@ -257,7 +257,7 @@ def main():
 				if st.sidebar.button("Scatterplot of Frequencies"):
 
 					df_plot = _analysis.dtm_weight_pl(df).with_columns(pl.selectors.numeric().mul(100))
-					df_plot = df_plot.with_columns(pl.col("doc_id").str.split_exact("_", 0).struct.rename_fields(["Group"]).alias("id")).unnest("id").to_pandas()
+					df_plot = _analysis.join_categories(df_plot, st.session_state[user_session_id]["target"]["docs"], "Group").to_pandas()
 
 					x_label = xaxis + ' ' + '(per 100 tokens)'
 					y_label = yaxis + ' ' + '(per 100 tokens)'
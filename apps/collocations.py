@@ -45,17 +45,44 @@ def main():
 
 		df = st.session_state[user_session_id]["target"]["collocations"]
 		
+		with st.sidebar.expander("Statistics explanation"):
+			st.markdown(_messages.message_association_measures)
+
+		# every measure is in the table, so choosing another one only re-sorts it
+		st.sidebar.markdown("### Association measure")			
+		stat_mode = st.sidebar.radio("Select a statistic:",
+							   list(_analysis.ASSOCIATION_MEASURES.values()), 
+							   horizontal=True)
+		st.sidebar.markdown("---")
+
+		if "Node" in df.columns:
+			# tables for a list of node words keep the order of the list
+			df = (
+				df
+				.with_columns(pl.struct(["Node", "Node Tag"]).rle_id().alias("node_id"))
+				.sort(["node_id", stat_mode, "Token"], descending=[False, True, False])
+				.drop("node_id")
+			)
+		else:
+			df = df.sort(stat_mode, "Token", descending=[True, False])
+		coll_info = metadata_target.get('collocations')[0]['temp']
+		
 		col1, col2 = st.columns([1,1])
 		with col1:
 			st.markdown(_messages.message_target_info(metadata_target))
 		with col2:
-			st.markdown(_messages.message_collocation_info(metadata_target.get('collocations')[0]['temp']))
+			st.markdown(_messages.message_collocation_info([coll_info[0], stat_mode, coll_info[2], coll_info[3]]))
 	
 		if df.height == 0 or df is None:
 			cats = []
 		elif df.height > 0:
 			cats = sorted(df.get_column("Tag").unique().to_list())
 
+		if "Node" in df.columns:
+			node_vals = st.multiselect("Select node words to filter:", (df.get_column("Node").unique(maintain_order=True).to_list()))
+			if len(node_vals) > 0:
+				df = df.filter(pl.col("Node").is_in(node_vals))
+
 		filter_vals = st.multiselect("Select tags to filter:", (cats))
 		if len(filter_vals) > 0:
 			df = df.filter(pl.col("Tag").is_in(filter_vals))
@@ -98,9 +125,19 @@ def main():
 			metadata_target = _handlers.load_metadata('target', user_session_id)
 
 		st.sidebar.markdown("### Node word")
-		st.sidebar.markdown("""Enter a node word without spaces.
-					""")				
-		node_word = st.sidebar.text_input("Node word:")
+		node_mode = st.sidebar.radio("Generate collocates for:", ("A node word", "A list of node words"), horizontal=True)
+		if node_mode == "A node word":
+			st.sidebar.markdown("""Enter a node word without spaces.
+						""")				
+			node_word = st.sidebar.text_input("Node word:")
+			node_lines = [node_word]
+		else:
+			st.sidebar.markdown("""Enter one node word per line.
+						A word can be followed by a space and a tag to anchor it (like *light NN* or *light Description*).
+						""")
+			node_text = st.sidebar.text_area("Node words:")
+			node_lines = [line.strip() for line in node_text.splitlines() if line.strip() != ""]
+			node_word = " ".join(node_lines)
 							
 		st.sidebar.markdown("---")
 		with st.sidebar.expander("Span explanation"):
@@ -110,60 +147,52 @@ def main():
 		to_left = st.sidebar.slider("Choose a span to the left of the node word:", 0, 9, (4))
 		to_right = st.sidebar.slider("Choose a span to the right of the node word:", 0, 9, (4))
 		
-		st.sidebar.markdown("---")
-		with st.sidebar.expander("Statistics explanation"):
-			st.markdown(_messages.message_association_measures)
-
-		st.sidebar.markdown("### Association measure")			
-		stat_mode = st.sidebar.radio("Select a statistic:",
-							   ["NPMI", "PMI 2", "PMI 3", "PMI"], 
-							   horizontal=True)
-		
-		if stat_mode == "PMI":
-			stat_mode = "pmi"
-		elif stat_mode == "PMI 2":
-			stat_mode = "pmi2"
-		elif stat_mode == "PMI 3":
-			stat_mode = "pmi3"
-		elif stat_mode == "NPMI":
-			stat_mode = "npmi"
 		
 		st.sidebar.markdown("---")
 		with st.sidebar.expander("Anchor tag for node word explanation"):
 			st.markdown(_messages.message_anchor_tags)
 		
 		st.sidebar.markdown("### Anchor tag")
-		tag_radio = st.sidebar.radio("Select tagset for node word:", ("No Tag", "Parts-of-Speech", "DocuScope"), horizontal=True)
-		if tag_radio == 'Parts-of-Speech':
-			tag_type = st.sidebar.radio("Select from general or specific tags", ("General", "Specific"), horizontal=True)
-			if tag_type == 'General':
-				node_tag = st.sidebar.selectbox("Select tag:", ("Noun Common", "Verb Lex", "Adjective", "Adverb"))
-				if node_tag == "Noun Common":
-					node_tag = "NN"
-				elif node_tag == "Verb Lex":
-					node_tag = "VV"
-				elif node_tag == "Adjective":
-					node_tag = "JJ"
-				elif node_tag == "Adverb":
-					node_tag = "R"
+		if node_mode == "A list of node words":
+			tag_radio = st.sidebar.radio("Select tagset for node words:", ("Parts-of-Speech", "DocuScope"), horizontal=True)
+			node_tag = None
+			ignore_tags = False
+			if tag_radio == 'Parts-of-Speech':
+				count_by = 'pos'
 			else:
+				count_by = 'ds'
+		else:
+			tag_radio = st.sidebar.radio("Select tagset for node word:", ("No Tag", "Parts-of-Speech", "DocuScope"), horizontal=True)
+			if tag_radio == 'Parts-of-Speech':
+				tag_type = st.sidebar.radio("Select from general or specific tags", ("General", "Specific"), horizontal=True)
+				if tag_type == 'General':
+					node_tag = st.sidebar.selectbox("Select tag:", ("Noun Common", "Verb Lex", "Adjective", "Adverb"))
+					if node_tag == "Noun Common":
+						node_tag = "NN"
+					elif node_tag == "Verb Lex":
+						node_tag = "VV"
+					elif node_tag == "Adjective":
+						node_tag = "JJ"
+					elif node_tag == "Adverb":
+						node_tag = "R"
+				else:
+					if session.get('has_target')[0] == False:
+						node_tag = st.sidebar.selectbox('Choose a tag:', ['No tags currently loaded'])
+					else:
+						node_tag = st.sidebar.selectbox('Choose a tag:', metadata_target.get('tags_pos')[0]['tags'])
+				ignore_tags = False
+				count_by = 'pos'
+			elif tag_radio == 'DocuScope':
 				if session.get('has_target')[0] == False:
 					node_tag = st.sidebar.selectbox('Choose a tag:', ['No tags currently loaded'])
 				else:
-					node_tag = st.sidebar.selectbox('Choose a tag:', metadata_target.get('tags_pos')[0]['tags'])
-			ignore_tags = False
-			count_by = 'pos'
-		elif tag_radio == 'DocuScope':
-			if session.get('has_target')[0] == False:
-				node_tag = st.sidebar.selectbox('Choose a tag:', ['No tags currently loaded'])
+					node_tag = st.sidebar.selectbox('Choose a tag:', metadata_target.get('tags_ds')[0]['tags'])
+					ignore_tags = False
+					count_by = 'ds'
 			else:
-				node_tag = st.sidebar.selectbox('Choose a tag:', metadata_target.get('tags_ds')[0]['tags'])
+				node_tag = None
 				ignore_tags = False
-				count_by = 'ds'
-		else:
-			node_tag = None
-			ignore_tags = False
-			count_by = 'pos'
+				count_by = 'pos'
 		
 		st.sidebar.markdown("---")
 		st.sidebar.markdown(_messages.message_generate_table)
@@ -172,16 +201,32 @@ def main():
 				st.markdown(_warnings.warning_11, unsafe_allow_html=True)
 			elif node_word == "":
 				st.markdown(_warnings.warning_14, unsafe_allow_html=True)
-			elif node_word.count(" ") > 0:
+			elif node_mode == "A node word" and node_word.count(" ") > 0:
 				st.markdown(_warnings.warning_15, unsafe_allow_html=True)
-			elif len(node_word) > 15:
+			elif any(len(line.split()) > 2 for line in node_lines):
+				st.markdown(_warnings.warning_15, unsafe_allow_html=True)
+			elif any(len(line.split()[0]) > 15 for line in node_lines):
 				st.markdown(_warnings.warning_16, unsafe_allow_html=True)
 			else:
 				with st.sidebar:
 					with st.spinner('Processing collocates...'):
-						tok_pl = st.session_state[user_session_id]["target"]["ds_tokens"]
-
-						coll_df = _analysis.collocations_pl(tok_pl, node_word=node_word, node_tag=node_tag, preceding=to_left, following=to_right, statistic=stat_mode, count_by=count_by)
+						pos_units = st.session_state[user_session_id]["target"]["pos_units"]
+						ds_units = st.session_state[user_session_id]["target"]["ds_units"]
+						lexicon = st.session_state[user_session_id]["target"]["lexicon"]
+						pos_index = st.session_state[user_session_id]["target"]["pos_index"]
+						ds_index = st.session_state[user_session_id]["target"]["ds_index"]
+						pos_alpha_seq = st.session_state[user_session_id]["target"]["pos_alpha_seq"]
+						ds_alpha_seq = st.session_state[user_session_id]["target"]["ds_alpha_seq"]
+						ft_pos = st.session_state[user_session_id]["target"]["ft_pos"]
+						ft_ds = st.session_state[user_session_id]["target"]["ft_ds"]
+
+						if node_mode == "A node word":
+							coll_df = _analysis.collocations_pl(pos_units, ds_units, lexicon, node_word=node_word, node_tag=node_tag, preceding=to_left, following=to_right, count_by=count_by, pos_index=pos_index, ds_index=ds_index, ft_pos=ft_pos, ft_ds=ft_ds, pos_alpha_seq=pos_alpha_seq, ds_alpha_seq=ds_alpha_seq)
+						else:
+							node_words = [line.split()[0] for line in node_lines]
+							node_tags = [line.split()[1] if len(line.split()) > 1 else None for line in node_lines]
+							node_word = f"{len(node_words)} node words"
+							coll_df = _analysis.collocations_batch_pl(pos_units, ds_units, lexicon, node_words, node_tags, preceding=to_left, following=to_right, count_by=count_by, pos_index=pos_index, ds_index=ds_index, ft_pos=ft_pos, ft_ds=ft_ds, pos_alpha_seq=pos_alpha_seq, ds_alpha_seq=ds_alpha_seq)
 				
 				if coll_df.is_empty():
 					st.markdown(_warnings.warning_12, unsafe_allow_html=True)
@@ -191,7 +236,7 @@ def main():
 						st.session_state[user_session_id]["target"]["collocations"] = {}
 					st.session_state[user_session_id]["target"]["collocations"] = coll_df
 					_handlers.update_session('collocations', True, user_session_id)
-					_handlers.update_metadata('target', key='collocations', value=[node_word, stat_mode, str(to_left), str(to_right)], session_id=user_session_id)
+					_handlers.update_metadata('target', key='collocations', value=[node_word, 'pmi', str(to_left), str(to_right)], session_id=user_session_id)
 					st.rerun()
 
 	
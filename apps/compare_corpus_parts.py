@@ -47,11 +47,34 @@ def main():
 		_handlers.load_widget_state(pathlib.Path(__file__).stem, user_session_id)
 		metadata_target = _handlers.load_metadata('target', user_session_id)
 
+		# tables for every category hold all comparisons, with the category and its reference in the first columns
+		category_mode = "Category" in st.session_state[user_session_id]["target"]["kw_pos_cp"].columns
+		if category_mode == True:
+			cats_cp = st.session_state[user_session_id]["target"]["kc_cats_cp"]
+			st.sidebar.markdown("### Category")
+			category = st.sidebar.selectbox("Select a category:", cats_cp.get_column("Category").to_list())
+			references = st.session_state[user_session_id]["target"]["kw_pos_cp"].get_column("Reference").unique().to_list()
+			if references == ["Rest"]:
+				reference = "Rest"
+			else:
+				reference = st.sidebar.selectbox("Compare against:", ["Rest"] + [cat for cat in cats_cp.get_column("Category").to_list() if cat != category])
+			st.sidebar.markdown("---")
+			tar_cp = cats_cp.filter(pl.col("Category") == category)
+			if reference == "Rest":
+				ref_cp = cats_cp.filter(pl.col("Category") != category)
+			else:
+				ref_cp = cats_cp.filter(pl.col("Category") == reference)
+			keyness_parts = [[category], [reference]]
+			for col in ["Tokens_POS", "Tokens_DS", "Docs"]:
+				keyness_parts += [str(tar_cp.get_column(col).sum()), str(ref_cp.get_column(col).sum())]
+		else:
+			keyness_parts = metadata_target.get('keyness_parts')[0]['temp']
+
 		col1, col2 = st.columns([1,1])
 		with col1:
-			st.markdown(_messages.message_target_parts(metadata_target.get('keyness_parts')[0]['temp']))
+			st.markdown(_messages.message_target_parts(keyness_parts))
 		with col2:
-			st.markdown(_messages.message_reference_parts(metadata_target.get('keyness_parts')[0]['temp']))
+			st.markdown(_messages.message_reference_parts(keyness_parts))
 		
 		st.markdown("Showing keywords that reach significance at *p* < 0.01")
 
@@ -70,6 +93,9 @@ def main():
 					df = st.session_state[user_session_id]["target"]["kw_pos_cp"]
 			else:			
 				df = st.session_state[user_session_id]["target"]["kw_ds_cp"]
+			
+			if category_mode == True:
+				df = df.filter((pl.col("Category") == category) & (pl.col("Reference") == reference)).drop(["Category", "Reference"])
 		
 			if df.height == 0 or df is None:
 				cats = []
@@ -139,6 +165,9 @@ def main():
 				
 			else:
 				df = st.session_state[user_session_id]["target"]["kt_ds_cp"].filter(pl.col("Tag") != "Untagged")
+			
+			if category_mode == True:
+				df = df.filter((pl.col("Category") == category) & (pl.col("Reference") == reference)).drop(["Category", "Reference"])
 	
 			if df.height == 0 or df is None:
 				cats = []
@@ -224,24 +253,36 @@ def main():
 		
 		st.markdown(_messages.message_corpus_parts)
 		
-		st.sidebar.markdown("### Select categories to compare")
-		st.sidebar.markdown("After **target** and **reference** categories have been selected, click the button to generate a keyness table.")
-		
-		if session.get('has_meta')[0] == True:
-			metadata_target = _handlers.load_metadata('target', user_session_id)
-			st.sidebar.markdown('#### Target corpus categories:')
-			st.session_state[user_session_id]['tar'] = st.sidebar.multiselect("Select target categories:", (sorted(set(metadata_target.get('doccats')[0]['cats']))), _handlers.update_tar(user_session_id), key=f"tar_{user_session_id}")
-		else:
-			st.sidebar.multiselect("Select reference categories:", (['No categories to select']), key='empty_tar')
-		
-		if session.get('has_meta')[0] == True:
-			metadata_target = _handlers.load_metadata('target', user_session_id)
-			st.sidebar.markdown('#### Reference corpus categories:')
-			st.session_state[user_session_id]['ref'] = st.sidebar.multiselect("Select reference categories:", (sorted(set(metadata_target.get('doccats')[0]['cats']))), _handlers.update_ref(user_session_id), key=f"ref_{user_session_id}")
-		else:
-			st.sidebar.multiselect("Select reference categories:", (['No categories to select']), key='empty_ref')
-		
+		st.sidebar.markdown("### Comparison")
+		compare_mode = st.sidebar.radio("Select what to compare:", ("Selected categories", "Every category"), horizontal=True)
 		st.sidebar.markdown("---")
+
+		if compare_mode == "Every category":
+			st.sidebar.markdown("### Compare every category")
+			st.sidebar.markdown("Each category will be compared against the rest of the corpus.")
+			pairwise = st.sidebar.checkbox("Also compare each pair of categories")
+			
+			st.sidebar.markdown("---")
+
+		else:
+			st.sidebar.markdown("### Select categories to compare")
+			st.sidebar.markdown("After **target** and **reference** categories have been selected, click the button to generate a keyness table.")
+			
+			if session.get('has_meta')[0] == True:
+				metadata_target = _handlers.load_metadata('target', user_session_id)
+				st.sidebar.markdown('#### Target corpus categories:')
+				st.session_state[user_session_id]['tar'] = st.sidebar.multiselect("Select target categories:", (sorted(set(metadata_target.get('doccats')[0]['cats']))), _handlers.update_tar(user_session_id), key=f"tar_{user_session_id}")
+			else:
+				st.sidebar.multiselect("Select reference categories:", (['No categories to select']), key='empty_tar')
+			
+			if session.get('has_meta')[0] == True:
+				metadata_target = _handlers.load_metadata('target', user_session_id)
+				st.sidebar.markdown('#### Reference corpus categories:')
+				st.session_state[user_session_id]['ref'] = st.sidebar.multiselect("Select reference categories:", (sorted(set(metadata_target.get('doccats')[0]['cats']))), _handlers.update_ref(user_session_id), key=f"ref_{user_session_id}")
+			else:
+				st.sidebar.multiselect("Select reference categories:", (['No categories to select']), key='empty_ref')
+			
+			st.sidebar.markdown("---")
 		
 		st.sidebar.markdown(_messages.message_generate_table)
 		if st.sidebar.button("Keyness Table of Corpus Parts"):
@@ -249,6 +290,51 @@ def main():
 				st.markdown(_warnings.warning_11, unsafe_allow_html=True)
 			elif session.get('has_meta')[0] == False:
 				st.markdown(_warnings.warning_21, unsafe_allow_html=True)
+			elif compare_mode == "Every category" and len(set(_handlers.load_metadata('target', user_session_id).get('doccats')[0]['cats'])) < 2:
+				st.markdown(_warnings.warning_24, unsafe_allow_html=True)
+			elif compare_mode == "Every category":
+				with st.sidebar:
+					with st.spinner('Generating keywords...'):
+						pos_counts = st.session_state[user_session_id]["target"]["pos_counts"]
+						ds_counts = st.session_state[user_session_id]["target"]["ds_counts"]
+						lexicon = st.session_state[user_session_id]["target"]["lexicon"]
+
+						docs = st.session_state[user_session_id]["target"]["docs"]
+
+						cf_pos, cf_ds = _analysis.category_tables_pl(pos_counts, ds_counts, lexicon, docs)
+						ct_pos, ct_ds = _analysis.category_tables_pl(pos_counts, ds_counts, lexicon, docs, tags_only=True)
+
+						kw_pos_cp = _analysis.keyness_categories_pl(cf_pos, pairwise=pairwise)
+						kw_ds_cp  = _analysis.keyness_categories_pl(cf_ds, pairwise=pairwise)
+						kt_pos_cp = _analysis.keyness_categories_pl(ct_pos, tags_only=True, pairwise=pairwise)
+						kt_ds_cp  = _analysis.keyness_categories_pl(ct_ds, tags_only=True, pairwise=pairwise)
+
+						# token and document counts by category, for the information shown with each comparison
+						kc_cats_cp = (
+							ct_pos.group_by("Category").agg(pl.col("AF").sum().alias("Tokens_POS"), pl.col("N_Docs").first().alias("Docs"))
+							.join(ct_ds.group_by("Category").agg(pl.col("AF").sum().alias("Tokens_DS")), on="Category", how="left")
+							.sort("Category")
+						)
+					
+					if "kw_pos_cp" not in st.session_state[user_session_id]["target"]:
+						st.session_state[user_session_id]["target"]["kw_pos_cp"] = {}
+					st.session_state[user_session_id]["target"]["kw_pos_cp"] = kw_pos_cp
+					if "kw_ds_cp" not in st.session_state[user_session_id]["target"]:
+						st.session_state[user_session_id]["target"]["kw_ds_cp"] = {}
+					st.session_state[user_session_id]["target"]["kw_ds_cp"] = kw_ds_cp
+					if "kt_pos_cp" not in st.session_state[user_session_id]["target"]:
+						st.session_state[user_session_id]["target"]["kt_pos_cp"] = {}
+					st.session_state[user_session_id]["target"]["kt_pos_cp"] = kt_pos_cp
+					if "kt_ds_cp" not in st.session_state[user_session_id]["target"]:
+						st.session_state[user_session_id]["target"]["kt_ds_cp"] = {}
+					st.session_state[user_session_id]["target"]["kt_ds_cp"] = kt_ds_cp
+					if "kc_cats_cp" not in st.session_state[user_session_id]["target"]:
+						st.session_state[user_session_id]["target"]["kc_cats_cp"] = {}
+					st.session_state[user_session_id]["target"]["kc_cats_cp"] = kc_cats_cp
+					_handlers.update_session('keyness_parts', True, user_session_id)
+			
+					st.success('Keywords generated!')
+					st.rerun()
 			elif len(list(st.session_state[user_session_id]['tar'])) == 0 or len(list(st.session_state[user_session_id]['ref'])) == 0:
 				st.markdown(_warnings.warning_22, unsafe_allow_html=True)
 			else:
@@ -257,28 +343,34 @@ def main():
 						tar_list = list(st.session_state[user_session_id]['tar'])
 						ref_list = list(st.session_state[user_session_id]['ref'])
 
-						tok_pl = st.session_state[user_session_id]["target"]["ds_tokens"]
+						pos_counts = st.session_state[user_session_id]["target"]["pos_counts"]
+						ds_counts = st.session_state[user_session_id]["target"]["ds_counts"]
+						lexicon = st.session_state[user_session_id]["target"]["lexicon"]
+						docs = st.session_state[user_session_id]["target"]["docs"]
 
-						tar_pl = _analysis.subset_pl(tok_pl, tar_list)
-						ref_pl = _analysis.subset_pl(tok_pl, ref_list)
+						# the per-document count store is filtered by category and summed, rather than re-counting the units of each side
+						tar_pos = _analysis.subset_pl(pos_counts, tar_list, docs)
+						tar_ds = _analysis.subset_pl(ds_counts, tar_list, docs)
+						ref_pos = _analysis.subset_pl(pos_counts, ref_list, docs)
+						ref_ds = _analysis.subset_pl(ds_counts, ref_list, docs)
 											
-						wc_tar_pos, wc_tar_ds = _analysis.frequency_tables_pl(tar_pl)
-						tc_tar_pos, tc_tar_ds = _analysis.tag_tables_pl(tar_pl)
+						wc_tar_pos, wc_tar_ds = _analysis.frequency_counts_pl(tar_pos, tar_ds, lexicon)
+						tc_tar_pos, tc_tar_ds = _analysis.tag_counts_pl(tar_pos, tar_ds)
 		
-						wc_ref_pos, wc_ref_ds = _analysis.frequency_tables_pl(ref_pl)
-						tc_ref_pos, tc_ref_ds = _analysis.tag_tables_pl(ref_pl)
+						wc_ref_pos, wc_ref_ds = _analysis.frequency_counts_pl(ref_pos, ref_ds, lexicon)
+						tc_ref_pos, tc_ref_ds = _analysis.tag_counts_pl(ref_pos, ref_ds)
 
 						kw_pos_cp = _analysis.keyness_pl(wc_tar_pos, wc_ref_pos)
 						kw_ds_cp  = _analysis.keyness_pl(wc_tar_ds, wc_ref_ds)
 						kt_pos_cp = _analysis.keyness_pl(tc_tar_pos, tc_ref_pos, tags_only=True)
 						kt_ds_cp  = _analysis.keyness_pl(tc_tar_ds, tc_ref_ds, tags_only=True)
 
-						tar_tokens_pos = tar_pl.group_by(["doc_id", "pos_id", "pos_tag"]).agg(pl.col("token").str.concat("")).filter(pl.col("pos_tag") != "Y").height
-						ref_tokens_pos = ref_pl.group_by(["doc_id", "pos_id", "pos_tag"]).agg(pl.col("token").str.concat("")).filter(pl.col("pos_tag") != "Y").height
-						tar_tokens_ds = tar_pl.group_by(["doc_id", "ds_id", "ds_tag"]).agg(pl.col("token").str.concat("")).filter(~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged"))).height
-						ref_tokens_ds = ref_pl.group_by(["doc_id", "ds_id", "ds_tag"]).agg(pl.col("token").str.concat("")).filter(~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged"))).height
-						tar_ndocs = tar_pl.get_column("doc_id").unique().len()
-						ref_ndocs = ref_pl.get_column("doc_id").unique().len()
+						tar_tokens_pos = tar_pos.get_column("AF").sum()
+						ref_tokens_pos = ref_pos.get_column("AF").sum()
+						tar_tokens_ds = tar_ds.get_column("AF").sum()
+						ref_tokens_ds = ref_ds.get_column("AF").sum()
+						tar_ndocs = tar_pos.get_column("doc_id").n_unique()
+						ref_ndocs = ref_pos.get_column("doc_id").n_unique()
 					
 					if "kw_pos_cp" not in st.session_state[user_session_id]["target"]:
 						st.session_state[user_session_id]["target"]["kw_pos_cp"] = {}
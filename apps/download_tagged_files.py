@@ -49,10 +49,11 @@ def main():
 		tagset = 'ds'
 
 	if session.get('has_target')[0] == True:
-		tok_pl = st.session_state[user_session_id]["target"]["ds_tokens"]
+		pos_units = st.session_state[user_session_id]["target"]["pos_units"]
+		ds_units = st.session_state[user_session_id]["target"]["ds_units"]
 
 		with st.sidebar:
-			download_file = _handlers.convert_to_zip(tok_pl, tagset)
+			download_file = _handlers.convert_to_zip(pos_units, ds_units, tagset)
 
 			st.download_button(
     			label="Download to Zip",
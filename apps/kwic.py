@@ -85,7 +85,7 @@ def main():
 		
 		st.sidebar.markdown("---")
 		st.sidebar.markdown("### Search mode")
-		search_mode = st.sidebar.radio("Select search type:", ("Fixed", "Starts with", "Ends with", "Contains"), horizontal=True)
+		search_mode = st.sidebar.radio("Select search type:", ("Fixed", "Starts with", "Ends with", "Contains", "Wildcard", "Regex"), horizontal=True)
 		
 		if search_mode == "Fixed":
 			search_type = "fixed"
@@ -93,8 +93,12 @@ def main():
 			search_type = "starts_with"
 		elif search_mode == "Ends with":
 			search_type = "ends_with"
-		else:
+		elif search_mode == "Contains":
 			search_type = "contains"
+		elif search_mode == "Wildcard":
+			search_type = "wildcard"
+		else:
+			search_type = "regex"
 		
 		st.sidebar.markdown("---")
 		st.sidebar.markdown("### Case")
@@ -114,15 +118,24 @@ def main():
 				st.write(_warnings.warning_14, unsafe_allow_html=True)
 			elif node_word.count(" ") > 0:
 				st.write(_warnings.warning_15, unsafe_allow_html=True)
-			elif len(node_word) > 15:
+			# the length limit is for plain words; patterns are matched against the lexicon, so longer ones are cheap
+			elif len(node_word) > 15 and search_type not in ["wildcard", "regex"]:
 				st.write(_warnings.warning_16, unsafe_allow_html=True)
 			else:
-				tok_pl = st.session_state[user_session_id]["target"]["ds_tokens"]
+				pos_units = st.session_state[user_session_id]["target"]["pos_units"]
+				lexicon = st.session_state[user_session_id]["target"]["lexicon"]
+				pos_index = st.session_state[user_session_id]["target"]["pos_index"]
+				suffixes = st.session_state[user_session_id]["target"]["suffixes"]
 				
 				with st.sidebar:
 					with st.spinner('Processing KWIC...'):
-						kwic_df = _analysis.kwic_pl(tok_pl, node_word=node_word, search_type=search_type, ignore_case=ignore_case)
-				if kwic_df.is_empty() == False:
+						try:
+							kwic_df = _analysis.kwic_pl(pos_units, lexicon, node_word=node_word, search_type=search_type, ignore_case=ignore_case, pos_index=pos_index, suffixes=suffixes)
+						except pl.exceptions.ComputeError:
+							kwic_df = None
+				if kwic_df is None:
+					st.write(_warnings.warning_23, unsafe_allow_html=True)
+				elif kwic_df.is_empty() == False:
 					if "kwic" not in st.session_state[user_session_id]["target"]:
 						st.session_state[user_session_id]["target"]["kwic"] = {}
 					st.session_state[user_session_id]["target"]["kwic"] = kwic_df
@@ -18,12 +18,13 @@ import pathlib
 import polars as pl
 import spacy
 import streamlit as st
+import time
 
 import categories as _categories
 import states as _states
-from utilities import analysis_functions as _analysis
 from utilities import handlers_database as _handlers
 from utilities import handlers_imports as _imports
+from utilities import handlers_jobs as _jobs
 from utilities import messages as _messages
 from utilities import process_corpus as _process
 from utilities import warnings as _warnings
@@ -41,6 +42,11 @@ _options = _imports.import_options_general(OPTIONS)
 ENABLE_DETECT = _options['global']['check_language']
 DESKTOP = _options['global']['desktop_mode']
 CHECK_SIZE = _options['global']['check_size']
+N_PROCESS = _options['global'].get('n_process', 1)
+BATCH_SIZE = _options['global'].get('batch_size', 25)
+ENABLE_CACHE = _options['global'].get('enable_cache', False)
+CACHE_MAX_BYTES = _options['global'].get('cache_max_bytes', 0)
+JOB_MAX_AGE = _options['global'].get('job_max_age', 0)
 
 if CHECK_SIZE == True:
 	MAX_TEXT = _options['global']['max_bytes_text']
@@ -104,7 +110,7 @@ def main():
 			if load_cats == 'Yes':
 				if st.sidebar.button("Process Document Metadata"):
 					with st.spinner('Processing metadata...'):
-						doc_cats = _process.get_doc_cats(metadata_target.get('docids')[0]['ids'])
+						doc_cats = _process.get_doc_cats(st.session_state[user_session_id]["target"]["docs"])
 						if len(set(doc_cats)) > 1 and len(set(doc_cats)) < 21:
 							_handlers.update_metadata('target', 'doccats', doc_cats, user_session_id)
 							_handlers.update_session('has_meta', True, user_session_id)
@@ -163,14 +169,14 @@ def main():
 					st.markdown(_messages.message_load_target_external)
 
 					with st.form("ref-file-form", clear_on_submit=True):
-						ref_file = st.file_uploader("Upload your reference corpus", type=["parquet"], accept_multiple_files=False)
+						ref_file = st.file_uploader("Upload your reference corpus", type=["parquet"], accept_multiple_files=True)
 						submitted = st.form_submit_button("UPLOAD REFERENCE")
 						
 						if submitted:
 							st.session_state[user_session_id]['warning'] = 0
 							
 						try:
-							tok_pl = pl.read_parquet(ref_file)
+							tok_pl = _process.encode_tags_pl(_process.stack_docs_pl([pl.read_parquet(shard) for shard in ref_file]))
 							is_valid, dup_ref, corpus_size = _process.check_corpus_pl(tok_pl, check_size=True, check_ref=True, target_docs=metadata_target.get('docids')[0]['ids'])
 							if 'ready_to_process' not in st.session_state[user_session_id]:
 								st.session_state[user_session_id]['ready_to_process'] = False
@@ -183,7 +189,7 @@ def main():
 								st.session_state[user_session_id]['ready_to_process'] = False
 							st.session_state[user_session_id]['ready_to_process'] = False
 																							
-					if is_valid == False and ref_file is not None:
+					if is_valid == False and len(ref_file) > 0:
 						st.markdown(_warnings._12_polars_format, unsafe_allow_html=True)
 												
 					if CHECK_SIZE == True:
@@ -213,22 +219,8 @@ def main():
 						st.sidebar.markdown("Once you have selected a file, use the button to process your corpus.")
 
 						if st.sidebar.button("Load Reference Corpus"):
-							ds_tokens = tok_pl
-							ft_pos, ft_ds = _analysis.frequency_tables_pl(ds_tokens)
-							tt_pos, tt_ds = _analysis.tag_tables_pl(ds_tokens)
-							dtm_pos, dtm_ds = _analysis.dtm_pl(ds_tokens)
-
-							_handlers.load_corpus_new(
-								ds_tokens,
-								dtm_ds,
-								dtm_pos,
-								ft_ds,
-								ft_pos,
-								tt_ds,
-								tt_pos,
-								user_session_id,
-								'reference'
-								)
+							corpus_store = _process.build_corpus_store(tok_pl)
+							_handlers.load_corpus_new(corpus_store, user_session_id, 'reference')
 							_handlers.init_metadata_reference(user_session_id)
 							_handlers.update_session('has_reference', True, user_session_id)
 							st.sidebar.markdown("---")
@@ -296,48 +288,72 @@ def main():
 							""")
 							st.session_state[user_session_id]['ready_to_process'] = True
 	
-					if st.session_state[user_session_id]['ready_to_process'] == True:
+					ref_job = st.session_state[user_session_id].get('ref_job')
+
+					if st.session_state[user_session_id]['ready_to_process'] == True and ref_job is None:
 						st.sidebar.markdown("### Process Reference")
 						st.sidebar.markdown("Click the button to process your reference corpus files.")
 						if st.sidebar.button("Process Reference Corpus"):
-							with st.sidebar:
-								with st.spinner('Processing corpus data...'):
-									models = load_models()
-									selected_dict = metadata_target.get('model')[0]
-									nlp = models[selected_dict]
-
-									if ENABLE_DETECT == True:
-										detector = load_detector()
-										ref_corp, exceptions = _process.process_corpus_detect(ref_files, nlp, detector, Language.ENGLISH)
-									
-									if ENABLE_DETECT == False:
-										ref_corp, exceptions = _process.process_corpus(ref_files, nlp)
-								
-								if len(exceptions) > 0 and bool(ref_corp) == False:
+							models = load_models()
+							selected_dict = metadata_target.get('model')[0]
+							nlp = models[selected_dict]
+
+							if ENABLE_DETECT == True:
+								detector = load_detector()
+								ref_job = _jobs.submit_job(user_session_id, ref_files, nlp, detector, Language.ENGLISH, max_age=JOB_MAX_AGE, n_process=N_PROCESS, batch_size=BATCH_SIZE, use_cache=ENABLE_CACHE, cache_max_bytes=CACHE_MAX_BYTES)
+							
+							if ENABLE_DETECT == False:
+								ref_job = _jobs.submit_job(user_session_id, ref_files, nlp, max_age=JOB_MAX_AGE, n_process=N_PROCESS, batch_size=BATCH_SIZE, use_cache=ENABLE_CACHE, cache_max_bytes=CACHE_MAX_BYTES)
+
+							st.session_state[user_session_id]['ref_job'] = ref_job
+							st.rerun()
+						
+						st.sidebar.markdown("---")
+
+					if ref_job is not None:
+						job = _jobs.job_status(ref_job)
+						with st.sidebar:
+							if job is None:
+								st.markdown("### Process Reference")
+								st.warning("Processing was interrupted. Processed files are kept: use the button again to resume.")
+								st.session_state[user_session_id]['ref_job'] = None
+
+							elif job['status'] == 'running':
+								st.markdown("### Process Reference")
+								st.progress(job['progress'], text=f"Processing corpus data... {job['done']} of {job['total']} files")
+								if st.button("Cancel Processing"):
+									_jobs.cancel_job(ref_job)
+								time.sleep(1)
+								st.rerun()
+
+							elif job['status'] == 'cancelled':
+								st.markdown("### Process Reference")
+								st.warning(f"Processing stopped after {job['done']} of {job['total']} files. Processed files are kept: use the button again to resume.")
+								st.session_state[user_session_id]['ref_job'] = None
+
+							elif job['status'] == 'failed':
+								st.markdown("### Process Reference")
+								st.error(f"Processing failed after {job['done']} of {job['total']} files: {job['error']}. Processed files are kept: use the button again to retry.")
+								st.session_state[user_session_id]['ref_job'] = None
+
+							else:
+								collected = _jobs.collect_job(ref_job)
+								st.session_state[user_session_id]['ref_job'] = None
+								if collected is None:
+									st.rerun()
+								ds_tokens, exceptions = collected
+
+								if len(exceptions) > 0 and ds_tokens.is_empty() == True:
 									st.session_state[user_session_id]['warning'] = 11
 									exceptions = None
 									st.rerun()
 								
-								elif len(exceptions) > 0 and bool(ref_corp) == True:
+								elif len(exceptions) > 0 and ds_tokens.is_empty() == False:
 									st.session_state[user_session_id]['warning'] = 41
 									st.session_state[user_session_id]['ref_exceptions'] = exceptions
 
-									ds_tokens = _process.tokens_to_pl(ref_corp)
-									ft_pos, ft_ds = _analysis.frequency_tables_pl(ds_tokens)
-									tt_pos, tt_ds = _analysis.tag_tables_pl(ds_tokens)
-									dtm_pos, dtm_ds = _analysis.dtm_pl(ds_tokens)
-
-									_handlers.load_corpus_new(
-										ds_tokens,
-										dtm_ds,
-										dtm_pos,
-										ft_ds,
-										ft_pos,
-										tt_ds,
-										tt_pos,
-										user_session_id,
-										'reference'
-										)
+									corpus_store = _process.build_corpus_store(ds_tokens)
+									_handlers.load_corpus_new(corpus_store, user_session_id, 'reference')
 									_handlers.init_metadata_reference(user_session_id)
 									_handlers.update_session('has_reference', True, user_session_id)
 									st.rerun()
@@ -346,22 +362,8 @@ def main():
 									st.success('Processing complete!')
 									st.session_state[user_session_id]['warning'] = 0
 									
-									ds_tokens = _process.tokens_to_pl(ref_corp)
-									ft_pos, ft_ds = _analysis.frequency_tables_pl(ds_tokens)
-									tt_pos, tt_ds = _analysis.tag_tables_pl(ds_tokens)
-									dtm_pos, dtm_ds = _analysis.dtm_pl(ds_tokens)
-
-									_handlers.load_corpus_new(
-										ds_tokens,
-										dtm_ds,
-										dtm_pos,
-										ft_ds,
-										ft_pos,
-										tt_ds,
-										tt_pos,
-										user_session_id,
-										'reference'
-										)
+									corpus_store = _process.build_corpus_store(ds_tokens)
+									_handlers.load_corpus_new(corpus_store, user_session_id, 'reference')
 									_handlers.init_metadata_reference(user_session_id)
 									_handlers.update_session('has_reference', True, user_session_id)
 									st.rerun()
@@ -540,14 +542,14 @@ def main():
 			st.markdown(_messages.message_load_target_external)
 
 			with st.form("corpus-file-form", clear_on_submit=True):
-				corp_file = st.file_uploader("Upload your target corpus", type=["parquet"], accept_multiple_files=False)
+				corp_file = st.file_uploader("Upload your target corpus", type=["parquet"], accept_multiple_files=True)
 				submitted = st.form_submit_button("UPLOAD TARGET")
 				
 				if submitted:
 					st.session_state[user_session_id]['warning'] = 0
 
 				try:
-					tok_pl = pl.read_parquet(corp_file)
+					tok_pl = _process.encode_tags_pl(_process.stack_docs_pl([pl.read_parquet(shard) for shard in corp_file]))
 					is_valid, corpus_size = _process.check_corpus_pl(tok_pl, check_size=True, check_ref=False)
 					if 'ready_to_process' not in st.session_state[user_session_id]:
 						st.session_state[user_session_id]['ready_to_process'] = False
@@ -559,7 +561,7 @@ def main():
 						st.session_state[user_session_id]['ready_to_process'] = False
 					st.session_state[user_session_id]['ready_to_process'] = False
 																					
-			if is_valid == False and corp_file is not None:
+			if is_valid == False and len(corp_file) > 0:
 				st.markdown(_warnings._12_polars_format, unsafe_allow_html=True)
 										
 			if CHECK_SIZE == True:
@@ -585,22 +587,8 @@ def main():
 				st.sidebar.markdown("Once you have selected a file, use the button to process your corpus.")
 
 				if st.sidebar.button("Load Target Corpus"):
-					ds_tokens = tok_pl
-					ft_pos, ft_ds = _analysis.frequency_tables_pl(ds_tokens)
-					tt_pos, tt_ds = _analysis.tag_tables_pl(ds_tokens)
-					dtm_pos, dtm_ds = _analysis.dtm_pl(ds_tokens)
-
-					_handlers.load_corpus_new(
-						ds_tokens,
-						dtm_ds,
-						dtm_pos,
-						ft_ds,
-						ft_pos,
-						tt_ds,
-						tt_pos,
-						user_session_id,
-						'target'
-						)
+					corpus_store = _process.build_corpus_store(tok_pl)
+					_handlers.load_corpus_new(corpus_store, user_session_id, 'target')
 					_handlers.init_metadata_target(user_session_id)
 					_handlers.update_session('has_target', True, user_session_id)
 					st.sidebar.markdown("---")
@@ -669,43 +657,67 @@ def main():
 			
 			st.sidebar.markdown("---")
 				
-			if st.session_state[user_session_id]['ready_to_process'] == True:
+			target_job = st.session_state[user_session_id].get('target_job')
+
+			if st.session_state[user_session_id]['ready_to_process'] == True and target_job is None:
 				st.sidebar.markdown("### Process Target")
 				st.sidebar.markdown("Once you have selected your files, use the button to process your corpus.")
 				if st.sidebar.button("Process Target"):
-					with st.sidebar:
-						with st.spinner('Processing corpus data...'):
-							if ENABLE_DETECT == True:
-								detector = load_detector()
-								corp, exceptions = _process.process_corpus_detect(corp_files, nlp, detector, Language.ENGLISH)
+					if ENABLE_DETECT == True:
+						detector = load_detector()
+						target_job = _jobs.submit_job(user_session_id, corp_files, nlp, detector, Language.ENGLISH, max_age=JOB_MAX_AGE, n_process=N_PROCESS, batch_size=BATCH_SIZE, use_cache=ENABLE_CACHE, cache_max_bytes=CACHE_MAX_BYTES)
 
-							if ENABLE_DETECT == False:
-								corp, exceptions = _process.process_corpus(corp_files, nlp)
-						
-						if len(exceptions) > 0 and bool(corp) == False:
+					if ENABLE_DETECT == False:
+						target_job = _jobs.submit_job(user_session_id, corp_files, nlp, max_age=JOB_MAX_AGE, n_process=N_PROCESS, batch_size=BATCH_SIZE, use_cache=ENABLE_CACHE, cache_max_bytes=CACHE_MAX_BYTES)
+
+					st.session_state[user_session_id]['target_job'] = target_job
+					st.rerun()
+				
+				st.sidebar.markdown("---")
+
+			if target_job is not None:
+				job = _jobs.job_status(target_job)
+				with st.sidebar:
+					if job is None:
+						st.markdown("### Process Target")
+						st.warning("Processing was interrupted. Processed files are kept: use the button again to resume.")
+						st.session_state[user_session_id]['target_job'] = None
+
+					elif job['status'] == 'running':
+						st.markdown("### Process Target")
+						st.progress(job['progress'], text=f"Processing corpus data... {job['done']} of {job['total']} files")
+						if st.button("Cancel Processing"):
+							_jobs.cancel_job(target_job)
+						time.sleep(1)
+						st.rerun()
+
+					elif job['status'] == 'cancelled':
+						st.markdown("### Process Target")
+						st.warning(f"Processing stopped after {job['done']} of {job['total']} files. Processed files are kept: use the button again to resume.")
+						st.session_state[user_session_id]['target_job'] = None
+
+					elif job['status'] == 'failed':
+						st.markdown("### Process Target")
+						st.error(f"Processing failed after {job['done']} of {job['total']} files: {job['error']}. Processed files are kept: use the button again to retry.")
+						st.session_state[user_session_id]['target_job'] = None
+
+					else:
+						collected = _jobs.collect_job(target_job)
+						st.session_state[user_session_id]['target_job'] = None
+						if collected is None:
+							st.rerun()
+						ds_tokens, exceptions = collected
+
+						if len(exceptions) > 0 and ds_tokens.is_empty() == True:
 							st.session_state[user_session_id]['warning'] = 10
 							st.rerun()
 						
-						elif len(exceptions) > 0 and bool(corp) == True:
+						elif len(exceptions) > 0 and ds_tokens.is_empty() == False:
 							st.session_state[user_session_id]['warning'] = 40
 							st.session_state[user_session_id]['exceptions'] = exceptions
 
-							ds_tokens = _process.tokens_to_pl(corp)
-							ft_pos, ft_ds = _analysis.frequency_tables_pl(ds_tokens)
-							tt_pos, tt_ds = _analysis.tag_tables_pl(ds_tokens)
-							dtm_pos, dtm_ds = _analysis.dtm_pl(ds_tokens)
-
-							_handlers.load_corpus_new(
-								ds_tokens,
-								dtm_ds,
-								dtm_pos,
-								ft_ds,
-								ft_pos,
-								tt_ds,
-								tt_pos,
-								user_session_id,
-								'target'
-								)
+							corpus_store = _process.build_corpus_store(ds_tokens)
+							_handlers.load_corpus_new(corpus_store, user_session_id, 'target')
 							_handlers.init_metadata_target(user_session_id)
 							_handlers.update_session('has_target', True, user_session_id)
 							st.rerun()
@@ -714,22 +726,8 @@ def main():
 							st.success('Processing complete!')
 							st.session_state[user_session_id]['warning'] = 0
 
-							ds_tokens = _process.tokens_to_pl(corp)
-							ft_pos, ft_ds = _analysis.frequency_tables_pl(ds_tokens)
-							tt_pos, tt_ds = _analysis.tag_tables_pl(ds_tokens)
-							dtm_pos, dtm_ds = _analysis.dtm_pl(ds_tokens)
-
-							_handlers.load_corpus_new(
-								ds_tokens,
-								dtm_ds,
-								dtm_pos,
-								ft_ds,
-								ft_pos,
-								tt_ds,
-								tt_pos,
-								user_session_id,
-								'target'
-								)
+							corpus_store = _process.build_corpus_store(ds_tokens)
+							_handlers.load_corpus_new(corpus_store, user_session_id, 'target')
 							_handlers.init_metadata_target(user_session_id)
 							_handlers.update_session('has_target', True, user_session_id)
 							st.rerun()
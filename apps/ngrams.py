@@ -153,8 +153,10 @@ def main():
 				else:
 					with st.sidebar:
 						with st.spinner('Processing n-grams...'):
-							tok_pl = st.session_state[user_session_id]["target"]["ds_tokens"]
-							ngram_df = _analysis.ngrams_pl(tok_pl, ngram_span, count_by=ts)
+							pos_units = st.session_state[user_session_id]["target"]["pos_units"]
+							ds_units = st.session_state[user_session_id]["target"]["ds_units"]
+							lexicon = st.session_state[user_session_id]["target"]["lexicon"]
+							ngram_df = _analysis.ngrams_pl(pos_units, ds_units, lexicon, ngram_span, count_by=ts)
 					
 					#cap size of dataframe
 					if ngram_df.height < 2:
@@ -236,13 +238,20 @@ def main():
 				else:
 					with st.sidebar:
 						with st.spinner('Processing n-grams...'):
-							tok_pl = st.session_state[user_session_id]["target"]["ds_tokens"]
+							pos_units = st.session_state[user_session_id]["target"]["pos_units"]
+							ds_units = st.session_state[user_session_id]["target"]["ds_units"]
+							lexicon = st.session_state[user_session_id]["target"]["lexicon"]
+							pos_index = st.session_state[user_session_id]["target"]["pos_index"]
+							ds_index = st.session_state[user_session_id]["target"]["ds_index"]
+							suffixes = st.session_state[user_session_id]["target"]["suffixes"]
+							pos_word_seq = st.session_state[user_session_id]["target"]["pos_word_seq"]
+							ds_word_seq = st.session_state[user_session_id]["target"]["ds_word_seq"]
 
 							if from_anchor == 'Token':
-								ngram_df = _analysis.ngrams_by_token_pl(tok_pl, node_word, position, ngram_span, search, ts)
+								ngram_df = _analysis.ngrams_by_token_pl(pos_units, ds_units, lexicon, node_word, position, ngram_span, search, ts, pos_index=pos_index, ds_index=ds_index, suffixes=suffixes, pos_word_seq=pos_word_seq, ds_word_seq=ds_word_seq)
 								#cap size of dataframe
 							if from_anchor == 'Tag':
-								ngram_df = _analysis.ngrams_by_tag_pl(tok_pl, tag, position, ngram_span, ts)
+								ngram_df = _analysis.ngrams_by_tag_pl(pos_units, ds_units, lexicon, tag, position, ngram_span, ts)
 					
 					#cap size of dataframe
 					if ngram_df is None or ngram_df.height == 0:
@@ -232,9 +232,10 @@ def main():
 			if session.get('has_target')[0] == False:
 				st.markdown(_warnings.warning_11, unsafe_allow_html=True)
 			else:
-				tok_pl = st.session_state[user_session_id]["target"]["ds_tokens"]
+				pos_units = st.session_state[user_session_id]["target"]["pos_units"]
+				ds_units = st.session_state[user_session_id]["target"]["ds_units"]
 
-				doc_pos, doc_simple, doc_ds = _analysis.html_build_pl(tok_pl, doc_key)
+				doc_pos, doc_simple, doc_ds = _analysis.html_build_pl(pos_units, ds_units, doc_key)
 				
 				if "doc_pos" not in st.session_state[user_session_id]["target"]:
 					st.session_state[user_session_id]["target"]["doc_pos"] = {}
@@ -0,0 +1,92 @@
+# Copyright (C) 2024 David West Brown
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Tag a directory of plain text files from the command line, without the upload widget or its size limit.
+# The output folder holds ds_tokens in Parquet shards (part-00000.parquet, ...),
+# which can be selected together when loading a corpus from the "External" option.
+#
+#   python batch_tagger.py path/to/texts path/to/output --model large --n-process 4
+
+import argparse
+from collections import Counter
+import io
+import pathlib
+import sys
+
+import spacy
+from lingua import Language, LanguageDetectorBuilder
+
+from utilities import handlers_imports as _imports
+from utilities import process_corpus as _process
+
+HERE = pathlib.Path(__file__).parent.resolve()
+MODELS = {"large": str(HERE.joinpath("models/en_docusco_spacy")), "common": str(HERE.joinpath("models/en_docusco_spacy_cd"))}
+OPTIONS = str(HERE.joinpath("options.toml"))
+
+_options = _imports.import_options_general(OPTIONS)
+
+def read_files(paths):
+	for path in paths:
+		doc = io.BytesIO(path.read_bytes())
+		doc.name = path.name
+		yield doc
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Tag a directory of .txt files and write ds_tokens as Parquet shards.")
+	parser.add_argument("input_dir", help="folder of .txt files (searched recursively)")
+	parser.add_argument("output_dir", help="folder for the Parquet shards")
+	parser.add_argument("--model", choices=sorted(MODELS), default="large", help="DocuScope model: large or common dictionary")
+	parser.add_argument("--n-process", type=int, default=_options['global'].get('n_process', 1), help="number of tagging processes")
+	parser.add_argument("--batch-size", type=int, default=_options['global'].get('batch_size', 25), help="documents per tagging batch")
+	parser.add_argument("--shard-size", type=int, default=1000, help="documents per Parquet shard")
+	parser.add_argument("--check-language", action="store_true", help="skip files that are not in English")
+	parser.add_argument("--use-cache", action="store_true", help="read and write the tagging cache")
+	args = parser.parse_args(argv)
+
+	paths = sorted(pathlib.Path(args.input_dir).rglob("*.txt"))
+	if len(paths) == 0:
+		sys.exit(f"No .txt files found in {args.input_dir}")
+	doc_ids = Counter([_process.get_doc_id(path.name) for path in paths])
+	dup_ids = sorted([doc_id for doc_id, n in doc_ids.items() if n > 1])
+	if len(dup_ids) > 0:
+		sys.exit("File names must be unique. Duplicated: " + ", ".join(dup_ids))
+
+	nlp = spacy.load(MODELS[args.model])
+	if args.check_language:
+		detector = LanguageDetectorBuilder.from_all_languages().with_low_accuracy_mode().build()
+		detect_language = Language.ENGLISH
+	else:
+		detector = None
+		detect_language = None
+
+	exceptions = []
+	doc_stream = _process.stream_corpus(
+		read_files(paths),
+		nlp,
+		exceptions,
+		detector,
+		detect_language,
+		n_process=args.n_process,
+		batch_size=args.batch_size,
+		use_cache=args.use_cache,
+		cache_max_bytes=_options['global'].get('cache_max_bytes', 0)
+		)
+	shards = _process.parquet_sink(doc_stream, args.output_dir, shard_size=args.shard_size)
+
+	print(f"Tagged {len(paths) - len(exceptions)} of {len(paths)} files into {len(shards)} shards in {args.output_dir}")
+	if len(exceptions) > 0:
+		print("Files not processed: " + ", ".join(exceptions))
+
+if __name__ == "__main__":
+	main()
@@ -16,177 +16,246 @@ import altair as alt
 import numpy as np
 import pandas as pd
 import polars as pl
+import re
 import scipy
 from sklearn import decomposition
 
-def subset_pl(tok_pl, select_ids: list):
-	token_subset = (
-		tok_pl
-		.with_columns(
-			pl.col("doc_id").str.split_exact("_", 0)
-			.struct.rename_fields(["cat_id"])
-			.alias("id")
+# Units are counted and joined by their lexicon ids (pos_lex / ds_lex, see process_corpus.encode_lexicon_pl).
+# Patterns are evaluated against the lexicon, once per distinct form, and forms are looked up only for display.
+def lexicon_ids(lexicon, expr):
+	return(lexicon.filter(expr).get_column("lex_id"))
+
+def lexicon_forms(lexicon, col):
+	return(pl.lit(lexicon.get_column("form")).gather(pl.col(col)).alias(col))
+
+# Lexicon ids follow the sort order of the forms, so an exact form or a prefix is a contiguous range of ids found by binary search.
+# Endings are found the same way in the reversed forms of the suffix table (process_corpus.suffixes_pl), when one is given;
+# other patterns are tested against every form in the lexicon.
+def prefix_range(sorted_forms, prefix):
+	lo = sorted_forms.search_sorted(prefix, "left")
+	if prefix == "":
+		return(lo, len(sorted_forms))
+	if ord(prefix[-1]) == 0x10FFFF:
+		return(lo, len(sorted_forms))
+	hi = sorted_forms.search_sorted(prefix[:-1] + chr(ord(prefix[-1]) + 1), "left")
+	return(lo, hi)
+
+def search_lexicon(lexicon, node_word, search_type="fixed", suffixes=None):
+	forms = lexicon.get_column("form")
+	if search_type == "fixed":
+		lo = forms.search_sorted(node_word, "left")
+		hi = forms.search_sorted(node_word, "right")
+		return(lexicon.get_column("lex_id").slice(lo, hi - lo))
+	if search_type == "starts_with":
+		lo, hi = prefix_range(forms, node_word)
+		return(lexicon.get_column("lex_id").slice(lo, hi - lo))
+	if search_type == "ends_with" and suffixes is not None:
+		lo, hi = prefix_range(suffixes.get_column("suffix"), node_word[::-1])
+		return(suffixes.get_column("lex_id").slice(lo, hi - lo))
+	if search_type == "ends_with":
+		return(lexicon_ids(lexicon, pl.col("form").str.ends_with(node_word)))
+	if search_type == "contains":
+		return(lexicon_ids(lexicon, pl.col("form").str.contains(node_word, literal=True)))
+	if search_type == "regex":
+		return(lexicon_ids(lexicon, pl.col("form").str.contains("(?i)" + node_word)))
+	if search_type == "wildcard":
+		return(lexicon_ids(lexicon, pl.col("form").str.contains("(?i)" + wildcard_pattern(node_word))))
+
+# * stands for any run of characters and ? for any one character; the pattern has to match the whole form.
+def wildcard_pattern(node_word):
+	pattern = "".join(".*" if c == "*" else "." if c == "?" else re.escape(c) for c in node_word)
+	return("^" + pattern + "$")
+
+# Positions of the units matching a search, in ascending order.
+# Patterns are run against the lexicon, and the matching ids are read from the index (or the unit table).
+# A case-sensitive word search is also a match on the lowercased form, so the lexicon narrows the candidates
+# and only the tokens at those positions are tested as written. That does not hold for every pattern (a negated class, for one),
+# so case-sensitive patterns are run against the distinct tokens as written instead, and the forms of those that match give the candidates.
+def match_positions(unit_pl, lex_col, lexicon, node_word, search_type="fixed", ignore_case=True, index=None, suffixes=None):
+	if search_type in ["regex", "wildcard"] and ignore_case == False:
+		if search_type == "regex":
+			pattern = node_word
+		if search_type == "wildcard":
+			pattern = wildcard_pattern(node_word)
+		types = unit_pl.get_column("token").str.strip_chars().unique()
+		types = types.filter(types.str.contains(pattern))
+		ids = lexicon_ids(lexicon, pl.col("form").is_in(types.str.to_lowercase()))
+		hits = node_positions(unit_pl, lex_col, ids, index)
+		matched = unit_pl.get_column("token").gather(hits).str.strip_chars().is_in(types)
+		return(hits[matched.to_numpy()])
+	if search_type in ["regex", "wildcard"]:
+		ids = search_lexicon(lexicon, node_word, search_type)
+	elif search_type == "ends_with":
+		ids = search_lexicon(lexicon, node_word.lower().rstrip(), search_type, suffixes)
+	else:
+		ids = search_lexicon(lexicon, node_word.lower(), search_type, suffixes)
+	hits = node_positions(unit_pl, lex_col, ids, index)
+	if ignore_case == True:
+		return(hits)
+	tokens = unit_pl.get_column("token").gather(hits)
+	if search_type == "fixed":
+		matched = tokens.str.strip_chars() == node_word
+	elif search_type == "starts_with":
+		matched = tokens.str.strip_chars().str.starts_with(node_word)
+	elif search_type == "ends_with":
+		matched = tokens.str.ends_with(node_word)
+	elif search_type == "contains":
+		matched = tokens.str.strip_chars().str.contains(node_word, literal=True)
+	return(hits[matched.to_numpy()])
+
+# Positions of the units whose lexicon id is among ids, in ascending order.
+# With a positional index (process_corpus.index_pl) only the postings of those ids are read; without one the unit table is scanned.
+def node_positions(unit_pl, lex_col, ids, index=None):
+	if index is None:
+		return(np.flatnonzero(unit_pl.get_column(lex_col).is_in(ids).to_numpy()))
+	lex = index.get_column("lex_id").to_numpy()
+	positions = index.get_column("position").to_numpy()
+	ids = np.unique(np.asarray(ids.to_numpy(), dtype=lex.dtype))
+	starts = np.searchsorted(lex, ids, side="left")
+	ends = np.searchsorted(lex, ids, side="right")
+	hits = [positions[lo:hi] for lo, hi in zip(starts, ends) if hi > lo]
+	if len(hits) == 0:
+		return(np.empty(0, dtype=np.int64))
+	return(np.sort(np.concatenate(hits)).astype(np.int64))
+
+# Which hits are in a sequence of positions (process_corpus.sequence_tables_pl), found by binary search
+# so that the cost follows the number of hits rather than the length of the sequence.
+def in_sequence(sequence, hits):
+	ranks = np.searchsorted(sequence, hits)
+	return((ranks < len(sequence)) & (sequence[np.minimum(ranks, len(sequence) - 1)] == hits) if len(sequence) > 0 else np.zeros(len(hits), dtype=bool))
+
+# Gather the units at fixed offsets around hit positions, rather than shifting whole columns of the corpus.
+# sequence holds the positions of the units being read in order (all units when None, or those left after a filter);
+# offsets that run past either end of it give nulls, as a shifted column would.
+# With clip, offsets that land in another document also give nulls. A document's units are contiguous,
+# so comparing the doc_id at each gathered position with that of the hit is enough to find its edges.
+def gather_windows(unit_pl, hits, offsets, columns, sequence=None, clip=False):
+	if sequence is None:
+		ranks = hits
+		n = unit_pl.height
+	else:
+		ranks = np.searchsorted(sequence, hits)
+		n = len(sequence)
+	if clip == True:
+		hit_docs = unit_pl.get_column("doc_id").gather(hits)
+	windows = {}
+	for i in offsets:
+		idx = ranks + i
+		valid = (idx >= 0) & (idx < n)
+		rows = np.where(valid, idx, 0)
+		if sequence is not None:
+			rows = sequence[rows]
+		if clip == True:
+			valid = valid & (unit_pl.get_column("doc_id").gather(rows) == hit_docs).to_numpy()
+		rows = pl.select(pl.when(pl.Series(valid)).then(pl.Series(rows, dtype=pl.UInt32))).to_series()
+		for name, col in columns.items():
+			windows[f"{name}_{i}"] = unit_pl.get_column(col).gather(rows)
+	return(pl.DataFrame(windows))
+
+# Categories are read from the document table (process_corpus.doc_table_pl) rather than parsed from each row's doc_id.
+# The table's doc_id is cast to the type of the frame it is joined to; for the Categorical doc_id of the count store, the join is on integer codes.
+def doc_ids_pl(docs, tok_pl):
+	return(docs.with_columns(pl.col("doc_id").cast(tok_pl.schema["doc_id"])))
+
+def subset_pl(tok_pl, select_ids: list, docs):
+	select_docs = doc_ids_pl(docs, tok_pl).filter(pl.col("category").is_in(select_ids)).select("doc_id")
+	token_subset = tok_pl.join(select_docs, on="doc_id", how="semi")
+	return(token_subset)
+
+def join_categories(tok_pl, docs, name="cat_id"):
+	doc_cats = doc_ids_pl(docs, tok_pl).select("doc_id", pl.col("category").alias(name))
+	return(tok_pl.join(doc_cats, on="doc_id", how="left"))
+
+# Per-document count store: one row per document, token and tag, with the number of units (AF); doc_id is Categorical.
+# Built once when a corpus is loaded, over the same units as the frequency and tag tables (punctuation excluded),
+# so that the tables for the whole corpus or for any subset of its documents are summed from counts
+# rather than counted again from the unit tables.
+def count_tables_pl(pos_units, ds_units, lexicon):
+
+	punct_ids = lexicon_ids(lexicon, pl.col("form").str.contains("^[[[:punct:]] ]+$"))
+
+	pos_counts = (
+		pos_units
+		.filter(pl.col("pos_tag") != "Y")
+		.group_by(["doc_id", pl.col("pos_lex").alias("Token"), pl.col("pos_tag").alias("Tag")])
+		.agg(pl.len().cast(pl.UInt32).alias("AF"))
+		.sort(["doc_id", "Token"])
+		.with_columns(pl.col("doc_id").cast(pl.Categorical))
 		)
-		.unnest("id")
-		.filter(pl.col("cat_id").is_in(select_ids))
-		.drop("cat_id")
+
+	ds_counts = (
+		ds_units
+		.filter(~(pl.col("ds_lex").is_in(punct_ids) & (pl.col("ds_tag") == "Untagged")))
+		.group_by(["doc_id", pl.col("ds_lex").alias("Token"), pl.col("ds_tag").alias("Tag")])
+		.agg(pl.len().cast(pl.UInt32).alias("AF"))
+		.sort(["doc_id", "Token"])
+		.with_columns(pl.col("doc_id").cast(pl.Categorical))
 		)
-	return(token_subset)
 
-def frequency_tables_pl(tok_pl):
+	return(pos_counts, ds_counts)
+
+def frequency_counts_pl(pos_counts, ds_counts, lexicon):
 	
+	# summarize in long format: one row per token and tag, with Range counted over the documents in which it occurs
 	def summarize_counts(df):
+			n_docs = df.get_column("doc_id").n_unique()
 			df = (
 				df
-				.pivot(index="Token", on="doc_id", values="len", aggregate_function="sum")
-				.with_columns(
-					pl.all().exclude("Token").cast(pl.UInt32, strict=True)
-				)
-				# calculate range
-				.with_columns(
-					pl.sum_horizontal(pl.selectors.numeric().is_not_null())
-					.alias("Range")
-				)
-				.with_columns(
-					pl.selectors.numeric().fill_null(strategy="zero")
-				)
-				# normalize over total documents in corpus
-				.with_columns(
-						pl.col("Range").truediv(pl.sum_horizontal(pl.selectors.numeric().exclude("Range").is_not_null())).mul(100)
-				)
-				# calculate absolute frequency
-				.with_columns(
-					pl.sum_horizontal(pl.selectors.numeric().exclude("Range"))
-					.alias("AF")
+				.group_by(["Token", "Tag"])
+				.agg(
+					# calculate absolute frequency
+					pl.col("AF").sum().cast(pl.UInt32),
+					# calculate range and normalize over total documents in corpus
+					pl.len().truediv(n_docs).mul(100).alias("Range")
 				)
-				.sort("AF", descending = True)
-				.select(["Token", "AF", "Range"])
 				# calculate relative frequency
 				.with_columns(
 					pl.col("AF").truediv(pl.sum("AF")).mul(1000000)
 					.alias("RF")
 				)
 				# format data
-				.unnest("Token")
+				.with_columns(lexicon_forms(lexicon, "Token"), pl.col("Tag").cast(pl.String))
 				.select(["Token", "Tag", "AF", "RF", "Range"])
+				.sort(["AF", "Token"], descending=[True, False])
 				)
 			return(df)
-	
-	# format tokens and sum by doc_id
-	df_pos = (
-		tok_pl
-		.group_by(["doc_id", "pos_id", "pos_tag"], maintain_order = True)
-		.agg(
-			pl.col("token").str.concat("")
-		)
-		.with_columns(
-			pl.col("token").str.to_lowercase().str.strip_chars())
-		.filter(
-			pl.col("pos_tag") != "Y"
-		)
-		.rename({"pos_tag": "Tag"})
-		.rename({"token": "Token"})
-		.group_by(["doc_id", "Token", "Tag"]).len()
-		.with_columns(
-			pl.struct(["Token", "Tag"])
-		)
-		.select(pl.exclude("Tag"))
-		)
-	
-	df_pos = summarize_counts(df_pos).sort(["AF", "Token"], descending=[True, False])
-   
-	df_ds = (
-		tok_pl
-		.group_by(["doc_id", "ds_id", "ds_tag"], maintain_order = True)
-		.agg(
-			pl.col("token").str.concat("")
-		)
-		.with_columns(
-			pl.col("token").str.to_lowercase().str.strip_chars())
-		.filter(
-			~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged"))
-		)
-		.rename({"ds_tag": "Tag"})
-		.rename({"token": "Token"})
-		.group_by(["doc_id", "Token", "Tag"]).len()
-		.with_columns(
-			pl.struct(["Token", "Tag"])
-		)
-		.select(pl.exclude("Tag"))
-		)
-	
-	df_ds = summarize_counts(df_ds).sort(["AF", "Token"], descending=[True, False])
 
-	return(df_pos, df_ds)
-    
-def tag_tables_pl(tok_pl):
+	return(summarize_counts(pos_counts), summarize_counts(ds_counts))
+
+def tag_counts_pl(pos_counts, ds_counts):
 	
+	# summarize in long format: one row per tag, with Range counted over the documents in which it occurs
 	def summarize_counts(df):
+			n_docs = df.get_column("doc_id").n_unique()
 			df = (
 				df
-				.pivot(index="Tag", on="doc_id", values="len", aggregate_function="sum")
-				.with_columns(
-					pl.all().exclude("Tag").cast(pl.UInt32, strict=True)
+				.group_by("Tag")
+				.agg(
+					# calculate absolute frequency
+					pl.col("AF").sum().cast(pl.UInt32),
+					# calculate range and normalize over total documents in corpus
+					pl.col("doc_id").n_unique().truediv(n_docs).mul(100).alias("Range")
 				)
-				# calculate range
-				.with_columns(
-					Range=pl.sum_horizontal(pl.selectors.numeric().is_not_null())
-				)
- 				.with_columns(
-					pl.selectors.numeric().fill_null(strategy="zero")
-				)
-				# normalize over total documents in corpus
-				.with_columns(
-						pl.col("Range").truediv(pl.sum_horizontal(pl.selectors.numeric().exclude("Range").is_not_null())).mul(100)
-				)
-				# calculate absolute frequency
-				.with_columns(
-					pl.sum_horizontal(pl.selectors.numeric().exclude("Range"))
-					.alias("AF")
-				)
-				.sort("AF", descending = True)
-				.select(["Tag", "AF", "Range"])
 				# calculate relative frequency
 				.with_columns(
 					pl.col("AF").truediv(pl.sum("AF")).mul(100)
 					.alias("RF")
 				)
-			  .select(["Tag", "AF", "RF", "Range"])
+				.with_columns(pl.col("Tag").cast(pl.String))
+				.select(["Tag", "AF", "RF", "Range"])
+				.sort(["AF", "Tag"], descending=[True, False])
 				)
 			return(df)
-	
-	# format tokens and sum by doc_id
-	df_pos = (
-		tok_pl
-		.filter(pl.col("pos_tag") != "Y")
-		.group_by(["doc_id", "pos_id", "pos_tag"], maintain_order = True)
-		.first()
-		.group_by(["doc_id", "pos_tag"]).len()
-		.rename({"pos_tag": "Tag"})
-		)
-	
-	df_pos = summarize_counts(df_pos).sort(["AF", "Tag"], descending=[True, False])
-   
-	df_ds = (
-		tok_pl
-		.filter(~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged")))
-		.group_by(["doc_id", "ds_id", "ds_tag"], maintain_order = True)
-		.first()
-		.group_by(["doc_id", "ds_tag"]).len()
-		.rename({"ds_tag": "Tag"})
-		)
-	
-	df_ds = summarize_counts(df_ds).sort(["AF", "Tag"], descending=[True, False])
 
-	return(df_pos, df_ds)
+	return(summarize_counts(pos_counts), summarize_counts(ds_counts))
+
+def dtm_pl(pos_units, ds_units, lexicon):
 
-def dtm_pl(tok_pl):
+	punct_ids = lexicon_ids(lexicon, pl.col("form").str.contains("^[[[:punct:]] ]+$"))
 	
 	df_pos = (
-		tok_pl
+		pos_units
 		.filter(pl.col("pos_tag") != "Y")
-		.group_by(["doc_id", "pos_id", "pos_tag"], maintain_order = True)
-		.first()
 		.group_by(["doc_id", "pos_tag"]).len()
 		.rename({"pos_tag": "tag"})
 		.with_columns(pl.col("len").sum().over('tag').alias('total'))
@@ -196,10 +265,8 @@ def dtm_pl(tok_pl):
 		)
 
 	df_ds = (
-		tok_pl
-		.filter(~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged")))
-		.group_by(["doc_id", "ds_id", "ds_tag"], maintain_order = True)
-		.first()
+		ds_units
+		.filter(~(pl.col("ds_lex").is_in(punct_ids) & (pl.col("ds_tag") == "Untagged")))
 		.group_by(["doc_id", "ds_tag"]).len()
 		.rename({"ds_tag": "tag"})
 		.with_columns(pl.col("len").sum().over('tag').alias('total'))
@@ -210,111 +277,166 @@ def dtm_pl(tok_pl):
 
 	return(df_pos, df_ds)
 
-def collocations_pl(tok_pl, node_word, preceding=4, following=4, statistic='pmi', count_by='pos', node_tag=None):
+# Columns of the association measures in a collocations table, keyed by the name of the statistic.
+ASSOCIATION_MEASURES = {
+	"pmi": "PMI",
+	"npmi": "NPMI",
+	"pmi2": "PMI 2",
+	"pmi3": "PMI 3",
+	"ll": "LL",
+	"tscore": "T Score",
+	"logdice": "Log Dice"
+}
+
+# All measures are computed together from Freq_Span and Freq_Total, so that a table can be re-sorted by any of them.
+# The PMI family compares the span frequency with node_freq * Freq_Total / token_total.
+# Log-likelihood and the t-score use a 2x2 table of the span positions (span_total) against the rest of the corpus;
+# log-likelihood is signed, negative when a collocate is less frequent in the spans than expected.
+# node_freq and span_total may be numbers or columns (one value per node, in a batch).
+def association_measures(node_freq, span_total, token_total):
+	p_span = pl.col("Freq_Span").truediv(token_total).log(base=2)
+	pmi = p_span.sub(pl.col("Freq_Total").truediv(token_total).mul(node_freq).truediv(token_total).log(base=2))
+
+	o11 = pl.col("Freq_Span").cast(pl.Float64)
+	o12 = (span_total - o11).clip(lower_bound=0)
+	o21 = (pl.col("Freq_Total") - o11).clip(lower_bound=0)
+	o22 = (token_total - span_total - pl.col("Freq_Total") + o11).clip(lower_bound=0)
+	e11 = pl.col("Freq_Total").mul(span_total).truediv(token_total)
+	e12 = (token_total - pl.col("Freq_Total")).mul(span_total).truediv(token_total)
+	e21 = pl.col("Freq_Total").mul(token_total - span_total).truediv(token_total)
+	e22 = (token_total - pl.col("Freq_Total")).mul(token_total - span_total).truediv(token_total)
+	ll = 2 * pl.sum_horizontal([pl.when(o > 0).then(o.mul(o.truediv(e).log())).otherwise(0) for o, e in [(o11, e11), (o12, e12), (o21, e21), (o22, e22)]])
+
+	measures = [
+		pmi.alias("PMI"),
+		pmi.truediv(p_span.neg()).alias("NPMI"),
+		pmi.sub(p_span.mul(-1)).alias("PMI 2"),
+		pmi.sub(p_span.mul(-2)).alias("PMI 3"),
+		pl.when(o11 < e11).then(ll.neg()).otherwise(ll).alias("LL"),
+		o11.sub(e11).truediv(o11.sqrt()).alias("T Score"),
+		o11.mul(2).truediv(pl.col("Freq_Total").add(node_freq)).log(base=2).add(14).alias("Log Dice")
+	]
+	return(measures)
+
+# Count the collocates in the spans around hit positions. Spans are read over the units with alphabetic forms,
+# and the hits are placed in that sequence. nodes labels each hit with the node it belongs to, so the spans of any number
+# of nodes are gathered together. Returns the counts by node, lexicon id and tag, and the number of span positions filled per node.
+def span_counts(unit_pl, grouping_lex, grouping_tag, lexicon, hits, nodes, preceding, following, sequence=None):
+	if sequence is None:
+		sequence = node_positions(unit_pl, grouping_lex, lexicon_ids(lexicon, pl.col("form").str.contains("[a-z]")))
+	else:
+		sequence = sequence.to_numpy()
+	hits_in = in_sequence(sequence, hits)
+	hits = hits[hits_in]
+	nodes = nodes[hits_in]
+	offsets = [i for i in range(-preceding, following + 1) if i != 0]
+	if len(offsets) == 0:
+		offsets = [0]
+		hits = hits[:0]
+		nodes = nodes[:0]
+	windows = gather_windows(unit_pl, hits, offsets, {"tok_lag": grouping_lex, "tag_lag": grouping_tag}, sequence)
+	windows = windows.with_columns(pl.Series("node_id", nodes, dtype=pl.UInt32))
+	span_df = (
+		pl.concat([
+			windows.select("node_id", pl.col(f"tok_lag_{i}").alias("Token"), pl.col(f"tag_lag_{i}").alias("Tag")) for i in offsets
+			])
+		.drop_nulls()
+	)
+	counts = span_df.group_by(["node_id", "Token", "Tag"]).len(name="Freq_Span")
+	span_totals = span_df.group_by("node_id").len(name="Span_Total")
+	return(counts, span_totals)
+
+# Marginal frequencies: the frequency tables built when the corpus is loaded hold the total of every token and tag
+# over the same units that collocations count (frequency_counts_pl), so they are reused when passed in.
+def collocation_totals(unit_pl, grouping_lex, grouping_tag, lexicon, expr_filter):
+	total_df = (
+		unit_pl
+		.filter(expr_filter)
+		.group_by([grouping_lex, grouping_tag]).len(name="AF")
+		.rename({grouping_lex: "Token", grouping_tag: "Tag"})
+		.with_columns(lexicon_forms(lexicon, "Token"), pl.col("Tag").cast(pl.String))
+	)
+	return(total_df)
+
+# Collocates of many node words in one pass: hits for every node are read from the index and their spans gathered together.
+# node_tags, when given, holds a tag prefix (or None) for each node word. The result is in long format, with a row per node and collocate.
+def collocations_batch_pl(pos_units, ds_units, lexicon, node_words: list, node_tags=None, preceding=4, following=4, statistic='pmi', count_by='pos', pos_index=None, ds_index=None, ft_pos=None, ft_ds=None, pos_alpha_seq=None, ds_alpha_seq=None):
 
 	if count_by == 'pos':
+		unit_pl = pos_units
+		unit_index = pos_index
+		unit_sequence = pos_alpha_seq
+		total_df = ft_pos
 		grouping_tag = "pos_tag"
-		grouping_id = "pos_id"
+		grouping_lex = "pos_lex"
 		expr_filter = pl.col("pos_tag") != "Y"
 	else:
+		unit_pl = ds_units
+		unit_index = ds_index
+		unit_sequence = ds_alpha_seq
+		total_df = ft_ds
 		grouping_tag = "ds_tag"
-		grouping_id = "ds_id"
-		expr_filter = ~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged"))
+		grouping_lex = "ds_lex"
+		expr_filter = ~(pl.col("ds_lex").is_in(lexicon_ids(lexicon, pl.col("form").str.contains("^[[[:punct:]] ]+$"))) & (pl.col("ds_tag") == "Untagged"))
 
-	if node_tag is None:
-		expr = pl.col("token") == node_word.lower()
-	else:
-		expr = (pl.col("token") == node_word.lower()) & (pl.col(grouping_tag).str.starts_with(node_tag))
+	if node_tags is None:
+		node_tags = [None] * len(node_words)
 
-	look_around_token = [
-		pl.col("token").shift(-i).alias(f"tok_lag_{i}") for i in range(-preceding, following + 1)
-	]
-	look_around_tag = [
-		pl.col(grouping_tag).shift(-i).alias(f"tag_lag_{i}") for i in range(-preceding, following + 1)
-	]
+	if total_df is None:
+		total_df = collocation_totals(unit_pl, grouping_lex, grouping_tag, lexicon, expr_filter)
+	total_df = total_df.select(["Token", "Tag", pl.col("AF").alias("Freq_Total")])
 
-	total_df = (
-		tok_pl
-		.group_by(["doc_id", grouping_id, grouping_tag], maintain_order = True)
-		.agg(
-			pl.col("token").str.concat("")
-			)
-		.with_columns(
-			pl.col("token").str.to_lowercase().str.strip_chars())
-		.filter(expr_filter)
-		.group_by(["token", grouping_tag]).len(name="Freq_Total")
-		.rename({"token": "Token", grouping_tag: "Tag"})
+	token_total = total_df.get_column("Freq_Total").sum()
+
+	nodes_df = (
+		pl.DataFrame({"Node": node_words, "Node Tag": node_tags}, schema={"Node": pl.String, "Node Tag": pl.String})
+		.with_row_index("node_id")
+	)
+	node_freq = (
+		nodes_df
+		.join(total_df, left_on=pl.col("Node").str.to_lowercase(), right_on="Token")
+		.filter(pl.col("Node Tag").is_null() | pl.col("Tag").str.starts_with(pl.col("Node Tag")))
+		.group_by("node_id").agg(pl.col("Freq_Total").sum().alias("Node_Freq"))
 	)
+	nodes_df = nodes_df.join(node_freq, on="node_id").sort("node_id")
 
-	token_total = sum(total_df.get_column("Freq_Total"))
-	
-	if node_tag is None:
-		node_freq = total_df.filter(pl.col("Token") == node_word).get_column("Freq_Total").sum()
-	else:
-		node_freq = total_df.filter((pl.col("Token") == node_word.lower()) & (pl.col("Tag").str.starts_with(node_tag))).get_column("Freq_Total").sum()
-			
-	if node_freq == 0:
-		coll_df = pl.DataFrame(schema=[("Token", pl.String), ("Tag", pl.String), ("Freq Span", pl.UInt32), ("Freq Total", pl.UInt32), ("MI", pl.Float64)])
-		return(coll_df)
-
-	if statistic=='pmi':
-		mi_funct = pl.col("Freq_Span").truediv(token_total).log(base=2).sub(pl.col("Freq_Total").truediv(token_total).mul(node_freq).truediv(token_total).log(base=2))
-	if statistic=='npmi':
-		mi_funct = pl.col("Freq_Span").truediv(token_total).log(base=2).sub(pl.col("Freq_Total").truediv(token_total).mul(node_freq).truediv(token_total).log(base=2)).truediv(pl.col("Freq_Span").truediv(token_total).log(base=2).neg())
-	if statistic=='pmi2':
-		mi_funct = pl.col("Freq_Span").truediv(token_total).log(base=2).sub(pl.col("Freq_Total").truediv(token_total).mul(node_freq).truediv(token_total).log(base=2)).sub(pl.col("Freq_Span").truediv(token_total).log(base=2).mul(-1))
-	if statistic=='pmi3':
-		mi_funct = pl.col("Freq_Span").truediv(token_total).log(base=2).sub(pl.col("Freq_Total").truediv(token_total).mul(node_freq).truediv(token_total).log(base=2)).sub(pl.col("Freq_Span").truediv(token_total).log(base=2).mul(-2))
+	hits = []
+	nodes = []
+	for node_id, node_word, node_tag in nodes_df.select(["node_id", "Node", "Node Tag"]).iter_rows():
+		node_hits = node_positions(unit_pl, grouping_lex, search_lexicon(lexicon, node_word.lower()), unit_index)
+		if node_tag is not None:
+			node_hits = node_hits[unit_pl.get_column(grouping_tag).cast(pl.String).gather(node_hits).str.starts_with(node_tag).to_numpy()]
+		hits.append(node_hits)
+		nodes.append(np.full(len(node_hits), node_id))
+	if len(hits) == 0:
+		hits = [np.empty(0, dtype=np.int64)]
+		nodes = [np.empty(0, dtype=np.int64)]
+
+	counts, span_totals = span_counts(unit_pl, grouping_lex, grouping_tag, lexicon, np.concatenate(hits), np.concatenate(nodes), preceding, following, unit_sequence)
 
 	coll_df = (
-		tok_pl
-		.group_by(["doc_id", grouping_id, grouping_tag], maintain_order = True)
-		.agg(
-			pl.col("token").str.concat("")
-			)
-		.with_columns(
-			pl.col("token").str.to_lowercase().str.strip_chars())
-		.filter(
-			pl.col('token').str.contains("[a-z]")
-			)
-		.with_columns(
-			look_around_token + look_around_tag
-			)
-		.filter(expr)
-		#.drop(["tok_lag_0", "tag_lag_0"])
-		.group_by("doc_id")
-		.agg(
-			pl.concat_list([f"tok_lag_{i}" for i in range(-preceding, following + 1)]).alias("span_tok"),
-			pl.concat_list([f"tag_lag_{i}" for i in range(-preceding, following + 1)]).alias("span_tag")
-			)
-		.explode(["span_tok", "span_tag"])
-		.with_columns(
-				pre_node_tok=pl.col("span_tok").list.head(preceding),
-				pre_node_tag=pl.col("span_tag").list.head(preceding)
-			)
-		.with_columns(
-				post_node_tok=pl.col("span_tok").list.tail(following),
-				post_node_tag=pl.col("span_tag").list.tail(following)
-			)
-		.drop(["span_tok", "span_tag"])
-		.with_columns(
-			Token=pl.col("pre_node_tok").list.concat("post_node_tok"),
-			Tag=pl.col("pre_node_tag").list.concat("post_node_tag")
-			)
-		.select(["Token", "Tag"])
-		.explode(["Token", "Tag"])
-		.group_by(["Token", "Tag"]).len(name="Freq_Span")
-		.sort("Freq_Span")
+		counts
+		.with_columns(lexicon_forms(lexicon, "Token"), pl.col("Tag").cast(pl.String))
 		.join(total_df, on=["Token", "Tag"])
+		.join(span_totals, on="node_id")
+		.join(nodes_df, on="node_id")
 		.with_columns(
-			MI=mi_funct
+			association_measures(pl.col("Node_Freq"), pl.col("Span_Total"), token_total)
 			)
 		.rename({"Freq_Span": "Freq Span", "Freq_Total": "Freq Total"})
-		.sort("MI", "Token", descending=[True, False])
+		.select(["node_id", "Node", "Node Tag", "Token", "Tag", "Freq Span", "Freq Total"] + list(ASSOCIATION_MEASURES.values()))
+		.sort(["node_id", ASSOCIATION_MEASURES[statistic], "Token"], descending=[False, True, False])
+		.drop("node_id")
 	)
-	
+
 	return(coll_df)
 
+def collocations_pl(pos_units, ds_units, lexicon, node_word, preceding=4, following=4, statistic='pmi', count_by='pos', node_tag=None, pos_index=None, ds_index=None, ft_pos=None, ft_ds=None, pos_alpha_seq=None, ds_alpha_seq=None):
+
+	coll_df = collocations_batch_pl(pos_units, ds_units, lexicon, [node_word], [node_tag], preceding=preceding, following=following, statistic=statistic, count_by=count_by, pos_index=pos_index, ds_index=ds_index, ft_pos=ft_pos, ft_ds=ft_ds, pos_alpha_seq=pos_alpha_seq, ds_alpha_seq=ds_alpha_seq)
+
+	return(coll_df.drop(["Node", "Node Tag"]))
+
 def keyness_pl(target_pl, reference_pl, correct=False, tags_only=False, threshold=.01):
 
 	total_target = target_pl.get_column("AF").sum()
@@ -387,49 +509,152 @@ def keyness_pl(target_pl, reference_pl, correct=False, tags_only=False, threshol
 			)
 			.alias("LR")
 		)
+		# effect sizes: %DIFF (Gabrielatos & Marchi), the odds ratio, and BIC, which approximates the Bayes factor (Wilson 2013)
+		# zero frequencies are replaced with .5, as for LR
 		.with_columns(
-			pl.col("LL").abs().map_elements(lambda x: scipy.stats.distributions.chi2.sf(x, 1), return_dtype=pl.Float64)
-			.alias("PV")
+			pl.when(pl.col("AF") == 0).then(.5).otherwise(pl.col("AF")).alias("AF_Adj"),
+			pl.when(pl.col("AF_Ref") == 0).then(.5).otherwise(pl.col("AF_Ref")).alias("AF_Ref_Adj")
+		)
+		.with_columns(
+			pl.col("AF").truediv(total_target)
+			.sub(pl.col("AF_Ref_Adj").truediv(total_reference))
+			.truediv(pl.col("AF_Ref_Adj").truediv(total_reference)).mul(100)
+			.alias("%DIFF"),
+			pl.col("AF_Adj").truediv(pl.lit(total_target).sub(pl.col("AF")))
+			.truediv(pl.col("AF_Ref_Adj").truediv(pl.lit(total_reference).sub(pl.col("AF_Ref"))))
+			.alias("OR"),
+			pl.col("LL").abs().sub(np.log(total_tokens))
+			.alias("BIC")
+		)
+	)
+
+	# p-values are computed for the whole column in one call, and the threshold is applied before sorting
+	kw_df = (
+		kw_df
+		.with_columns(
+			pl.Series("PV", scipy.stats.distributions.chi2.sf(kw_df.get_column("LL").abs().to_numpy(), 1), dtype=pl.Float64)
 		)
-		.sort("LL", descending=True)
 		.filter(pl.col("PV") < threshold)
+		.sort("LL", descending=True)
 	)
 	if tags_only == False:
-		return(kw_df.select(["Token", "Tag", "LL", "LR", "PV", "RF", "RF_Ref", "AF", "AF_Ref", "Range", "Range_Ref"]))
+		return(kw_df.select(["Token", "Tag", "LL", "LR", "PV", "%DIFF", "OR", "BIC", "RF", "RF_Ref", "AF", "AF_Ref", "Range", "Range_Ref"]))
 		
 	if tags_only == True:
-		return(kw_df.select(["Tag", "LL", "LR", "PV", "RF", "RF_Ref", "AF", "AF_Ref", "Range", "Range_Ref"]))
+		return(kw_df.select(["Tag", "LL", "LR", "PV", "%DIFF", "OR", "BIC", "RF", "RF_Ref", "AF", "AF_Ref", "Range", "Range_Ref"]))
 	
 
-def ngrams_by_token_pl(tok_pl, node_word: str, node_position, span, search_type, count_by='pos'):
+# Counts by document category, for keyness of every category at once. Documents are assigned to categories
+# from the document table, and the per-document counts (count_tables_pl) are summed by category.
+# Docs is the number of a category's documents in which a token (or tag) occurs
+# and N_Docs the number of documents in the category; since each document belongs to one category, both can be summed across categories.
+def category_tables_pl(pos_counts, ds_counts, lexicon, docs, tags_only=False):
+
+	if tags_only == False:
+		keys = ["Token", "Tag"]
+	if tags_only == True:
+		keys = ["Tag"]
+
+	def summarize_categories(doc_counts):
+		if tags_only == True:
+			doc_counts = doc_counts.group_by(["doc_id", "Tag"]).agg(pl.col("AF").sum())
+		doc_cats = (
+			join_categories(doc_counts.select(pl.col("doc_id").unique()), docs, "Category")
+			.with_columns(pl.len().over("Category").alias("N_Docs"))
+		)
+		df = (
+			doc_counts
+			.join(doc_cats, on="doc_id")
+			.group_by(["Category"] + keys)
+			.agg(
+				pl.col("AF").sum().cast(pl.UInt32),
+				pl.len().cast(pl.UInt32).alias("Docs"),
+				pl.col("N_Docs").first().cast(pl.UInt32)
+			)
+			.with_columns(pl.col("Tag").cast(pl.String))
+		)
+		if tags_only == False:
+			df = df.with_columns(lexicon_forms(lexicon, "Token"))
+		return(df.sort(["Category"] + keys))
+
+	return(summarize_categories(pos_counts), summarize_categories(ds_counts))
+
+# Keyness of each category against the rest of the corpus or, with pairwise, against each other category.
+# Both sides are summed from a category table (category_tables_pl) and compared with keyness_pl;
+# the result is in long format, with the category and its reference in the first columns.
+def keyness_categories_pl(cat_df, correct=False, tags_only=False, threshold=.01, pairwise=False):
+
+	if tags_only == False:
+		keys = ["Token", "Tag"]
+		scale = 1000000
+	if tags_only == True:
+		keys = ["Tag"]
+		scale = 100
+
+	def summarize_side(df):
+		n_docs = df.group_by("Category").agg(pl.col("N_Docs").first()).get_column("N_Docs").sum()
+		df = (
+			df
+			.group_by(keys)
+			.agg(pl.col("AF").sum().cast(pl.UInt32), pl.col("Docs").sum())
+			.with_columns(
+				pl.col("AF").truediv(pl.sum("AF")).mul(scale).alias("RF"),
+				pl.col("Docs").truediv(n_docs).mul(100).alias("Range")
+			)
+			.select(keys + ["AF", "RF", "Range"])
+		)
+		return(df)
+
+	categories = cat_df.get_column("Category").unique().sort().to_list()
+
+	kw_list = []
+	for category in categories:
+		target_df = summarize_side(cat_df.filter(pl.col("Category") == category))
+		if pairwise == False:
+			references = [("Rest", cat_df.filter(pl.col("Category") != category))]
+		if pairwise == True:
+			references = [(other, cat_df.filter(pl.col("Category") == other)) for other in categories if other != category]
+		for reference, reference_df in references:
+			kw_df = (
+				keyness_pl(target_df, summarize_side(reference_df), correct=correct, tags_only=tags_only, threshold=threshold)
+				.select(pl.lit(category).alias("Category"), pl.lit(reference).alias("Reference"), pl.all())
+			)
+			kw_list.append(kw_df)
+
+	if len(kw_list) == 0:
+		return(pl.DataFrame(schema={"Category": pl.String, "Reference": pl.String}))
+	return(pl.concat(kw_list))
+
+def ngrams_by_token_pl(pos_units, ds_units, lexicon, node_word: str, node_position, span, search_type, count_by='pos', pos_index=None, ds_index=None, suffixes=None, pos_word_seq=None, ds_word_seq=None):
 	
 	if count_by == 'pos':
+		unit_pl = pos_units
+		unit_index = pos_index
+		unit_sequence = pos_word_seq
 		grouping_tag = "pos_tag"
-		grouping_id = "pos_id"
+		grouping_lex = "pos_lex"
 		expr_filter = pl.col("pos_tag") != "Y"
 	else:
+		unit_pl = ds_units
+		unit_index = ds_index
+		unit_sequence = ds_word_seq
 		grouping_tag = "ds_tag"
-		grouping_id = "ds_id"
-		expr_filter = ~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged"))
-	
-	if search_type == "fixed":
-		expr = pl.col("token") == node_word.lower()
-	elif search_type == "starts_with":
-		expr = pl.col("token").str.starts_with(node_word.lower())
-	elif search_type == "ends_with":
-		expr = pl.col("token").str.ends_with(node_word.lower())
-	elif search_type == "contains":
-		expr = pl.col("token").str.contains(node_word.lower())
+		grouping_lex = "ds_lex"
+		expr_filter = ~(pl.col("ds_lex").is_in(lexicon_ids(lexicon, pl.col("form").str.contains("^[[[:punct:]] ]+$"))) & (pl.col("ds_tag") == "Untagged"))
 	
 	preceding = node_position - 1
 	following = span - node_position
-	
-	look_around_token = [
-		pl.col("token").shift(-i).alias(f"tok_lag_{i}") for i in range(-preceding, following + 1)
-	]
-	look_around_tag = [
-		pl.col(grouping_tag).shift(-i).alias(f"tag_lag_{i}") for i in range(-preceding, following + 1)
-	]
+	offsets = list(range(-preceding, following + 1))
+
+	# n-grams are read over the units left after the filter (stored with the corpus, or found by a scan when not passed);
+	# the node hits come from the index and are placed in that sequence
+	if unit_sequence is None:
+		sequence = np.flatnonzero(unit_pl.select(expr_filter).to_series().to_numpy())
+	else:
+		sequence = unit_sequence.to_numpy()
+	hits = match_positions(unit_pl, grouping_lex, lexicon, node_word, search_type, index=unit_index, suffixes=suffixes)
+	hits = hits[in_sequence(sequence, hits)]
+	windows = gather_windows(unit_pl, hits, offsets, {"tok_lag": grouping_lex, "tag_lag": grouping_tag}, sequence)
 
 	rename_tokens = [
 		 pl.col('ngram').struct.rename_fields([f'Token_{i + 1}' for i in range(span)])
@@ -439,25 +664,16 @@ def ngrams_by_token_pl(tok_pl, node_word: str, node_position, span, search_type,
 	]
 	
 	ngram_df = (
-		tok_pl
-		.group_by(["doc_id", grouping_id, grouping_tag], maintain_order = True)
-		.agg(
-			pl.col("token").str.concat("")
-			)
-		.filter(expr_filter)
-		.with_columns(pl.col("token").len().alias("total"))
+		windows
 		.with_columns(
-			pl.col("token").str.to_lowercase().str.strip_chars())
-		.with_columns(
-			look_around_token + look_around_tag
+			pl.col([f"tag_lag_{i}" for i in offsets]).cast(pl.String)
 			)
-		.filter(expr)
-		.group_by("doc_id", "total")
-		.agg(
-			pl.concat_list([f"tok_lag_{i}" for i in range(-preceding, following + 1)]).alias("ngram"),
-			pl.concat_list([f"tag_lag_{i}" for i in range(-preceding, following + 1)]).alias("tags")
+		.select(
+			unit_pl.get_column("doc_id").gather(hits),
+			pl.lit(len(sequence), dtype=pl.UInt32).alias("total"),
+			pl.concat_list([f"tok_lag_{i}" for i in offsets]).alias("ngram"),
+			pl.concat_list([f"tag_lag_{i}" for i in offsets]).alias("tags")
 			)
-		.explode(["ngram", "tags"])
 	)
 
 	if ngram_df.height == 0:
@@ -507,30 +723,35 @@ def ngrams_by_token_pl(tok_pl, node_word: str, node_position, span, search_type,
 			rename_tokens + rename_tags
 			)
 		.unnest(["ngram", "tags"])
+		.with_columns(
+			[lexicon_forms(lexicon, f"Token_{i + 1}") for i in range(span)]
+			)
 		)
 		return ngram_df
 
-def ngrams_by_tag_pl(tok_pl, tag: str, node_position, span, count_by='pos'):
+def ngrams_by_tag_pl(pos_units, ds_units, lexicon, tag: str, node_position, span, count_by='pos'):
 			
 	if count_by == 'pos':
+		unit_pl = pos_units
 		grouping_tag = "pos_tag"
-		grouping_id = "pos_id"
+		grouping_lex = "pos_lex"
 		expr = pl.col("pos_tag") == tag
 		expr_filter = pl.col("pos_tag") != "Y"
 	else:
+		unit_pl = ds_units
 		grouping_tag = "ds_tag"
-		grouping_id = "ds_id"
+		grouping_lex = "ds_lex"
 		expr = pl.col("ds_tag") == tag
-		expr_filter = ~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged"))
+		expr_filter = ~(pl.col("ds_lex").is_in(lexicon_ids(lexicon, pl.col("form").str.contains("^[[[:punct:]] ]+$"))) & (pl.col("ds_tag") == "Untagged"))
 	
 	preceding = node_position - 1
 	following = span - node_position
 	
 	look_around_token = [
-		pl.col("token").shift(-i).alias(f"tok_lag_{i}") for i in range(-preceding, following + 1)
+		pl.col(grouping_lex).shift(-i).alias(f"tok_lag_{i}") for i in range(-preceding, following + 1)
 	]
 	look_around_tag = [
-		pl.col(grouping_tag).shift(-i).alias(f"tag_lag_{i}") for i in range(-preceding, following + 1)
+		pl.col(grouping_tag).cast(pl.String).shift(-i).alias(f"tag_lag_{i}") for i in range(-preceding, following + 1)
 	]
 
 	rename_tokens = [
@@ -541,15 +762,9 @@ def ngrams_by_tag_pl(tok_pl, tag: str, node_position, span, count_by='pos'):
 	]
 	
 	ngram_df = (
-		tok_pl
-		.group_by(["doc_id", grouping_id, grouping_tag], maintain_order = True)
-		.agg(
-			pl.col("token").str.concat("")
-			)
+		unit_pl
 		.filter(expr_filter)
-		.with_columns(pl.col("token").len().alias("total"))
-		.with_columns(
-			pl.col("token").str.to_lowercase().str.strip_chars())
+		.with_columns(pl.col(grouping_lex).len().alias("total"))
 		.with_columns(
 			look_around_token + look_around_tag
 			)
@@ -608,144 +823,100 @@ def ngrams_by_tag_pl(tok_pl, tag: str, node_position, span, count_by='pos'):
 			rename_tokens + rename_tags
 			)
 		.unnest(["ngram", "tags"])
+		.with_columns(
+			[lexicon_forms(lexicon, f"Token_{i + 1}") for i in range(span)]
+			)
 		)
 		return ngram_df
 
-def ngrams_pl(tok_pl, span, count_by='pos', min_frequency=10):
+# N-grams are counted on integer keys rather than lists of strings. Each unit is coded from its lexicon id and tag,
+# and an n-gram's key is built one unit at a time: the key of its (n-1)-gram prefix paired with the next unit's code,
+# renumbered densely after every step so that keys stay small whatever the span.
+# An n-gram can be no more frequent than its prefix, so positions whose prefix falls below min_frequency are dropped
+# before the next unit is added. Range counts the distinct documents of each key instead of pivoting a column per document.
+def ngrams_pl(pos_units, ds_units, lexicon, span, count_by='pos', min_frequency=10):
 	
 	if count_by == 'pos':
+		unit_pl = pos_units
 		grouping_tag = "pos_tag"
-		grouping_id = "pos_id"
+		grouping_lex = "pos_lex"
 		expr_filter = pl.col("pos_tag") != "Y"
 	else:
+		unit_pl = ds_units
 		grouping_tag = "ds_tag"
-		grouping_id = "ds_id"
-		expr_filter = ~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged"))
-		
-	look_around_token = [
-		pl.col("token").shift(-i).alias(f"tok_lag_{i}") for i in range(span)
-    ]
-	look_around_tag = [
-		pl.col(grouping_tag).shift(-i).alias(f"tag_lag_{i}") for i in range(span)
-    ]
+		grouping_lex = "ds_lex"
+		expr_filter = ~(pl.col("ds_lex").is_in(lexicon_ids(lexicon, pl.col("form").str.contains("^[[[:punct:]] ]+$"))) & (pl.col("ds_tag") == "Untagged"))
+
+	unit_pl = unit_pl.filter(expr_filter)
+	total = unit_pl.height
+	n_docs = unit_pl.get_column("doc_id").n_unique()
+
+	tags = unit_pl.get_column(grouping_tag).cat.to_local()
+	n_tags = len(tags.cat.get_categories())
+	codes = unit_pl.get_column(grouping_lex).to_numpy().astype(np.uint64) * n_tags + tags.to_physical().to_numpy().astype(np.uint64)
+	# windows that run past the last unit are padded with a code of their own, as shifted columns would be with nulls
+	pad = codes.max() + 1 if total > 0 else 0
+	codes = np.concatenate([codes, np.full(span - 1, pad, dtype=np.uint64)])
+
+	positions = np.arange(total)
+	keys = np.zeros(total, dtype=np.uint64)
+	for i in range(span):
+		keys, ngram_ids = np.unique(keys * (pad + 1) + codes[positions + i], return_inverse=True)
+		keys = np.arange(len(keys), dtype=np.uint64)[ngram_ids]
+		if min_frequency > 0:
+			counts = np.bincount(ngram_ids, minlength=len(keys))
+			keep = counts[ngram_ids] / total * 1000000 >= min_frequency
+			positions = positions[keep]
+			keys = keys[keep]
 
-	rename_tokens = [
-		 pl.col('ngram').struct.rename_fields([f'Token_{i + 1}' for i in range(span)])
-	]
-	rename_tags = [
-		 pl.col('tags').struct.rename_fields([f'Tag_{i + 1}' for i in range(span)])
-	]
-	
 	ngram_df = (
-		tok_pl
-		.group_by(["doc_id", grouping_id, grouping_tag], maintain_order = True)
-		.agg(
-			pl.col("token").str.concat("")
-			)
-		.filter(expr_filter)
-		.with_columns(pl.col("token").len().alias("total"))
-		.with_columns(
-			pl.col("token").str.to_lowercase().str.strip_chars())
-		.with_columns(
-			look_around_token + look_around_tag
-			)
-		.group_by("doc_id", "total")
+		pl.DataFrame({"ngram_id": keys, "position": positions}, schema={"ngram_id": pl.UInt64, "position": pl.UInt32})
+		.with_columns(unit_pl.get_column("doc_id").gather(positions))
+		.group_by("ngram_id")
 		.agg(
-			pl.concat_list([f"tok_lag_{i}" for i in range(span)]).alias("ngram"),
-			pl.concat_list([f"tag_lag_{i}" for i in range(span)]).alias("tags")
+			pl.col("position").first(),
+			pl.len().cast(pl.UInt32).alias("AF"),
+			pl.col("doc_id").n_unique().truediv(n_docs).mul(100).alias("Range")
 			)
-		.explode(["ngram", "tags"])
-		.with_columns(
-			pl.col(["ngram", "tags"]).list.to_struct()
-			)
-		.group_by(["doc_id", "total", "ngram", "tags"]).len().sort("len", descending=True)
-		.with_columns(
-			pl.struct(["ngram", "tags"])
-			)
-		.select(pl.exclude("tags"))
-		.pivot(index=["ngram", "total"], on="doc_id", values="len", aggregate_function="sum")
-		.with_columns(
-			pl.all().exclude("ngram").cast(pl.UInt32, strict=True)
-			)
-		# calculate range
-		.with_columns(
-			pl.sum_horizontal(pl.selectors.numeric().exclude("total").is_not_null())
-			.alias("Range")
-			)
-		.with_columns(
-			pl.selectors.numeric().fill_null(strategy="zero")
-			)
-		# normalize over total documents in corpus
-		.with_columns(
-				pl.col("Range").truediv(pl.sum_horizontal(pl.selectors.numeric().exclude(["Range", "total"]).is_not_null())).mul(100)
-			)
-		# calculate absolute frequency
-		.with_columns(
-			pl.sum_horizontal(pl.selectors.numeric().exclude(["Range", "total"]))
-			.alias("AF")
-			)
-		.sort("AF", descending = True)
-        # calculate relative frequency
-		.with_columns(
-			pl.col("AF").truediv(pl.col("total")).mul(1000000)
-			.alias("RF")
-			)
-		.select(["ngram", "AF", "RF", "Range"])
-		.unnest("ngram")
+	)
+
+	windows = gather_windows(unit_pl, ngram_df.get_column("position").to_numpy(), range(span), {"Token": grouping_lex, "Tag": grouping_tag})
+
+	ngram_df = (
+		pl.concat([
+			windows.select(
+				[pl.col(f"Token_{i}").alias(f"Token_{i + 1}") for i in range(span)] +
+				[pl.col(f"Tag_{i}").cast(pl.String).alias(f"Tag_{i + 1}") for i in range(span)]
+				),
+			ngram_df.select("AF", pl.col("AF").truediv(total).mul(1000000).alias("RF"), "Range")
+			], how="horizontal")
 		.with_columns(
-			rename_tokens + rename_tags
+			[lexicon_forms(lexicon, f"Token_{i + 1}") for i in range(span)]
 			)
-		.unnest(["ngram", "tags"])
 		.sort(["AF", "Token_1", "Token_2"], descending=[True, False, False])
 		.filter(
-               pl.col('RF') >= min_frequency
+			pl.col('RF') >= min_frequency
 			)
-		)
+	)
 	
 	return ngram_df
 
-def kwic_pl(tok_pl, node_word: str, search_type="fixed", ignore_case=True):
+def kwic_pl(pos_units, lexicon, node_word: str, search_type="fixed", ignore_case=True, pos_index=None, suffixes=None):
 	
-	if search_type == "fixed" and ignore_case == True:
-		expr = pl.col("token").str.to_lowercase().str.strip_chars() == node_word.lower()
-	if search_type == "fixed" and ignore_case == False:
-		expr = pl.col("token").str.strip_chars() == node_word
-	elif search_type == "starts_with" and ignore_case == True:
-		expr = pl.col("token").str.to_lowercase().str.strip_chars().str.starts_with(node_word.lower())
-	elif search_type == "starts_with" and ignore_case == False:
-		expr = pl.col("token").str.strip_chars().str.starts_with(node_word)
-	elif search_type == "ends_with" and ignore_case == True:
-		expr = pl.col("token").str.to_lowercase().str.strip_chars().str.ends_with(node_word.lower())
-	elif search_type == "ends_with" and ignore_case == False:
-		expr = pl.col("token").str.ends_with(node_word)
-	elif search_type == "contains" and ignore_case == True:
-		expr = pl.col("token").str.to_lowercase().str.strip_chars().str.contains(node_word.lower())
-	elif search_type == "contains" and ignore_case == False:
-		expr = pl.col("token").str.strip_chars().str.contains(node_word)
-
+	hits = match_positions(pos_units, "pos_lex", lexicon, node_word, search_type, ignore_case, pos_index, suffixes)
 	
 	preceding = 7
 	following = 7
 	
-	look_around_token = [
-		pl.col("token").shift(-i).alias(f"tok_lag_{i}") for i in range(-preceding, following + 1)
-    ]
+	# context is gathered around each hit and stops at the edges of its document
+	windows = gather_windows(pos_units, hits, range(-preceding, following + 1), {"tok_lag": "token"}, clip=True)
 	
 	kwic_df = (
-		tok_pl
-		.group_by(["doc_id", "pos_id"], maintain_order = True)
-		.agg(
-			pl.col("token").str.concat("")
-			)
-		.with_columns(
-			look_around_token
-			)
-		.filter(expr)
-		.group_by("doc_id")
-		.agg(
+		windows
+		.select(
+			pos_units.get_column("doc_id").gather(hits),
 			pl.concat_list([f"tok_lag_{i}" for i in range(-preceding, following + 1)]).alias("node")
 			)
-		.explode("node")
 		.with_columns(
 			pre_node=pl.col("node").list.head(7)
 		)
@@ -762,7 +933,7 @@ def kwic_pl(tok_pl, node_word: str, search_type="fixed", ignore_case=True):
 			pl.col("post_node").list.join("")
 		)
 		.select(["doc_id", "pre_node", "node", "post_node"])
-		.sort("doc_id")
+		.sort("doc_id", maintain_order=True)
         .rename({"doc_id": "Doc ID", "pre_node": "Pre-Node", "node": "Node", "post_node": "Post-Node"})
 	)
 	
@@ -810,6 +981,88 @@ def dtm_weight_pl(dtm_pl, scheme="prop"):
 	)
 	return(weighted_df)
 
+# Sparse document-term matrices, built from the per-document count store (count_tables_pl) rather than by pivoting,
+# so that a matrix of documents by tokens holds only the cells that are not zero.
+# A matrix is returned with its labels: a CSR matrix with a row per document (in the order of the document table, docs)
+# and a column per token or tag (by="token" or by="tag"), ordered by total frequency as in dtm_pl.
+def dtm_sparse_pl(counts, docs, lexicon, by="token"):
+	if by == "token":
+		key = "Token"
+		label = lexicon_forms(lexicon, "Token").alias("term")
+	if by == "tag":
+		key = "Tag"
+		label = pl.col("Tag").cast(pl.String).alias("term")
+
+	rows = docs.select("doc_id").with_row_index("row")
+	terms = (
+		counts
+		.group_by(key).agg(pl.col("AF").sum().alias("total"))
+		.with_columns(label)
+		.sort(["total", "term"], descending=[True, False])
+		.with_row_index("col")
+	)
+	cells = (
+		counts
+		.join(rows, on="doc_id")
+		.join(terms.select(["col", key]), on=key)
+	)
+	# cells of the same document and term (a token with several tags) are summed
+	dtm = scipy.sparse.csr_matrix(
+		(cells.get_column("AF").cast(pl.Float64).to_numpy(), (cells.get_column("row").to_numpy(), cells.get_column("col").to_numpy())),
+		shape=(rows.height, terms.height)
+		)
+	return(dtm, rows.get_column("doc_id").cast(pl.String), terms.get_column("term"))
+
+# The schemes of dtm_weight_pl, applied to the stored values of a sparse matrix.
+# Scaling divides each column by its standard deviation but does not center it, since centering would fill every cell;
+# a column that does not vary is set to zero.
+def dtm_sparse_weight(dtm, scheme="prop"):
+	dtm = dtm.astype(np.float64).tocsr()
+	n_docs = dtm.shape[0]
+	if scheme == "prop":
+		totals = np.asarray(dtm.sum(axis=1)).ravel()
+		weights = np.divide(1, totals, out=np.zeros_like(totals), where=totals > 0)
+		return(scipy.sparse.diags(weights).dot(dtm).tocsr())
+	if scheme == "scale":
+		means = np.asarray(dtm.mean(axis=0)).ravel()
+		squares = np.asarray(dtm.multiply(dtm).mean(axis=0)).ravel()
+		sd = np.sqrt(np.clip(squares - np.square(means), 0, None) * n_docs / (n_docs - 1))
+		weights = np.divide(1, sd, out=np.zeros_like(sd), where=sd > 0)
+	if scheme == "tfidf":
+		doc_freq = np.diff(dtm.tocsc().indptr)
+		weights = np.log10(np.divide(n_docs, doc_freq, out=np.ones(len(doc_freq)), where=doc_freq > 0))
+	return(dtm.dot(scipy.sparse.diags(weights)).tocsr())
+
+# A sparse matrix in polars is a long frame of its cells (doc_id, term, value). doc_id and term are Enums listing every row and column label,
+# so that their physical codes are the row and column indices, and documents or terms with no cells survive the round trip, including through parquet.
+def dtm_sparse_to_pl(dtm, doc_ids, terms):
+	dtm = dtm.tocoo()
+	df = pl.DataFrame({
+		"doc_id": pl.Series(dtm.row, dtype=pl.UInt32),
+		"term": pl.Series(dtm.col, dtype=pl.UInt32),
+		"value": pl.Series(dtm.data, dtype=pl.Float64)
+		})
+	df = df.with_columns(
+		pl.lit(pl.Series(doc_ids, dtype=pl.Enum(doc_ids))).gather(pl.col("doc_id")).alias("doc_id"),
+		pl.lit(pl.Series(terms, dtype=pl.Enum(terms))).gather(pl.col("term")).alias("term")
+		)
+	return(df.sort(["doc_id", "term"]))
+
+def dtm_sparse_from_pl(dtm_pl):
+	doc_ids = dtm_pl.schema["doc_id"].categories
+	terms = dtm_pl.schema["term"].categories
+	dtm = scipy.sparse.csr_matrix(
+		(dtm_pl.get_column("value").to_numpy(), (dtm_pl.get_column("doc_id").to_physical().to_numpy(), dtm_pl.get_column("term").to_physical().to_numpy())),
+		shape=(len(doc_ids), len(terms))
+		)
+	return(dtm, doc_ids, terms)
+
+def write_dtm_sparse(dtm, doc_ids, terms, path):
+	dtm_sparse_to_pl(dtm, doc_ids, terms).write_parquet(path)
+
+def read_dtm_sparse(path):
+	return(dtm_sparse_from_pl(pl.read_parquet(path)))
+
 def dtm_simplify_pl(dtm_pl):
  simple_df = (
 	dtm_pl
@@ -989,20 +1242,15 @@ def correlation(df, x, y):
 	cc_df = len(df.index) - 2
 	return cc_df, cc_r, cc_p
 
-def boxplots_pl(dtm_pl, box_vals, grp_a = None, grp_b = None):
+def boxplots_pl(dtm_pl, box_vals, docs, grp_a = None, grp_b = None):
 
 	df_plot = (
 		dtm_pl
 		.unpivot(pl.selectors.numeric(), index="doc_id", variable_name="Tag", value_name="RF")
 		.with_columns(pl.col("RF").mul(100))
 		.filter(pl.col("Tag").is_in(box_vals))
-		.with_columns(
-			pl.col("doc_id").str.split_exact("_", 0)
-			.struct.rename_fields(["cat_id"])
-			.alias("id")
-			)
-		.unnest("id")
 	)
+	df_plot = join_categories(df_plot, docs)
 
 	if grp_a is None and grp_b is None:	
 
@@ -1033,7 +1281,7 @@ def boxplots_pl(dtm_pl, box_vals, grp_a = None, grp_b = None):
 			)
 		return(df_plot)
 	
-def scatterplots_pl(dtm_pl, axis_vals: list):
+def scatterplots_pl(dtm_pl, axis_vals: list, docs):
 
 	df_plot = (
 		dtm_pl
@@ -1044,13 +1292,10 @@ def scatterplots_pl(dtm_pl, axis_vals: list):
 			.otherwise(pl.lit("Other"))
 			.alias("Tag_Sort")
 		)
-		.with_columns(
-			pl.col("doc_id").str.split_exact("_", 0)
-			.struct.rename_fields(["cat_id"])
-			.alias("id")
-			)
-		.unnest("id")
-		.drop("cat_id", "Tag")
+	)
+	df_plot = (
+		join_categories(df_plot, docs, "Group")
+		.drop("Tag")
 		.group_by(["doc_id", "Group", "Tag_Sort"]).sum()
 		.with_columns(pl.col("AF").truediv(pl.sum("AF").over("doc_id")).mul(100).alias("RF"))
 		.filter(pl.col("Tag_Sort") != "Other")
@@ -1062,12 +1307,11 @@ def scatterplots_pl(dtm_pl, axis_vals: list):
 	return(df_plot)
 
 
-def html_build_pl(tok_pl, doc_key):
+def html_build_pl(pos_units, ds_units, doc_key):
 	html_pos = (
-		tok_pl
+		pos_units
 		.filter(pl.col("doc_id") == doc_key)
-		.group_by(["pos_id", "pos_tag"], maintain_order = True)
-		.agg(pl.col("token").str.concat(""))
+		.with_columns(pl.col("pos_tag").cast(pl.String))
 		.with_columns(pl.col("token").str.extract("(\s)$")
 					.alias("ws"))
 		.with_columns(pl.col("token").str.strip_chars())
@@ -1095,10 +1339,9 @@ def html_build_pl(tok_pl, doc_key):
 	)
 
 	html_simple = (
-		tok_pl
+		pos_units
 		.filter(pl.col("doc_id") == doc_key)
-		.group_by(["pos_id", "pos_tag"], maintain_order = True)
-		.agg(pl.col("token").str.concat(""))
+		.with_columns(pl.col("pos_tag").cast(pl.String))
 		.with_columns(pl.col("pos_tag")
 		.str.replace('^NN\S*$', '#NounCommon')
 		.str.replace('^VV\S*$', '#VerbLex')
@@ -1142,10 +1385,9 @@ def html_build_pl(tok_pl, doc_key):
 	)
 
 	html_ds = (
-		tok_pl
+		ds_units
 		.filter(pl.col("doc_id") == doc_key)
-		.group_by(["ds_id", "ds_tag"], maintain_order = True)
-		.agg(pl.col("token").str.concat(""))
+		.with_columns(pl.col("ds_tag").cast(pl.String))
 		.with_columns(pl.col("token").str.extract("(\s)$")
 					.alias("ws"))
 		.with_columns(pl.col("token").str.strip_chars())
@@ -0,0 +1,102 @@
+# Copyright (C) 2024 David West Brown
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import os
+import pathlib
+import threading
+
+import polars as pl
+
+HERE = pathlib.Path(__file__).parents[1].resolve()
+CACHE_DIR = HERE.joinpath("_cache")
+
+# Functions for caching tagged documents on disk.
+# Entries are content-addressed: the key is a hash of the text that was sent to the tagger,
+# stored under a folder named for the model (name and version from the model's meta.json).
+# Re-uploading the same text with the same model reads the tags back instead of re-running spaCy.
+# Language detection verdicts are kept the same way, as small text files under a folder named for the language checked.
+# Entries are written to a temporary file named for the writing thread and then moved into place,
+# so that jobs tagging the same text at once never share a partly written file.
+# Reading an entry refreshes its modification time so that eviction drops the least recently used files first.
+
+def model_key(nlp_model):
+	return f"{nlp_model.meta['name']}-{nlp_model.meta['version']}"
+
+def text_key(doc_txt):
+	return hashlib.sha256(doc_txt.encode('utf-8')).hexdigest()
+
+def cache_path(nlp_model, doc_txt):
+	return CACHE_DIR.joinpath(model_key(nlp_model), text_key(doc_txt) + ".parquet")
+
+def load_cached(nlp_model, doc_txt):
+	path = cache_path(nlp_model, doc_txt)
+	try:
+		df = pl.read_parquet(path)
+		os.utime(path)
+	except:
+		return(None)
+	return(df)
+
+def save_cached(nlp_model, doc_txt, df):
+	path = cache_path(nlp_model, doc_txt)
+	try:
+		os.makedirs(path.parent, exist_ok=True)
+		tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+		df.write_parquet(tmp_path)
+		os.replace(tmp_path, path)
+	except:
+		pass
+
+def verdict_path(detect_language, doc_txt):
+	return CACHE_DIR.joinpath(f"language-{detect_language.name.lower()}", text_key(doc_txt) + ".txt")
+
+def load_verdict(detect_language, doc_txt):
+	path = verdict_path(detect_language, doc_txt)
+	try:
+		verdict = path.read_text()
+		os.utime(path)
+	except:
+		return(None)
+	return(verdict == "True")
+
+def save_verdict(detect_language, doc_txt, verdict):
+	path = verdict_path(detect_language, doc_txt)
+	try:
+		os.makedirs(path.parent, exist_ok=True)
+		tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+		tmp_path.write_text(str(verdict))
+		os.replace(tmp_path, path)
+	except:
+		pass
+
+def evict_cache(max_bytes):
+	if max_bytes is None or max_bytes <= 0 or not CACHE_DIR.exists():
+		return
+	entries = []
+	for path in CACHE_DIR.glob("*/*.*"):
+		try:
+			stat = path.stat()
+		except:
+			continue
+		entries.append((stat.st_mtime, stat.st_size, path))
+	total = sum(size for _, size, _ in entries)
+	for _, size, path in sorted(entries):
+		if total <= max_bytes:
+			break
+		try:
+			os.remove(path)
+			total -= size
+		except:
+			pass
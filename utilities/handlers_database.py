@@ -29,6 +29,8 @@ import random
 import zipfile
 import xlsxwriter
 
+from utilities import process_corpus as _process
+
 HERE = pathlib.Path(__file__).parents[1].resolve()
 CORPUS_DIR = HERE.joinpath("_corpora")
 TEMP_DIR = HERE.joinpath("_temp")
@@ -89,6 +91,7 @@ def update_session(key, value, session_id):
 
 def init_metadata_target(session_id):
 	df = st.session_state[session_id]["target"]["ds_tokens"]
+	docs = st.session_state[session_id]["target"]["docs"]
 	tags_to_check = df.get_column("ds_tag").to_list()
 	tags = ['Actors', 'Organization', 'Planning', 'Sentiment', 'Signposting', 'Stance']
 	if any(tag in item for item in tags_to_check for tag in tags):
@@ -102,11 +105,11 @@ def init_metadata_target(session_id):
 	if "Y" in tags_pos:
 		tags_pos.remove("Y")
 	temp_metadata_target = {}
-	temp_metadata_target['tokens_pos'] = df.group_by(["doc_id", "pos_id", "pos_tag"]).agg(pl.col("token").str.concat("")).filter(pl.col("pos_tag") != "Y").height
-	temp_metadata_target['tokens_ds'] = df.group_by(["doc_id", "ds_id", "ds_tag"]).agg(pl.col("token").str.concat("")).filter(~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged"))).height
-	temp_metadata_target['ndocs'] = len(df.get_column("doc_id").unique().to_list())
+	temp_metadata_target['tokens_pos'] = docs.get_column("tokens_pos").sum()
+	temp_metadata_target['tokens_ds'] = docs.get_column("tokens_ds").sum()
+	temp_metadata_target['ndocs'] = docs.height
 	temp_metadata_target['model'] = model
-	temp_metadata_target['docids'] = {'ids': sorted(df.get_column("doc_id").unique().to_list())}
+	temp_metadata_target['docids'] = {'ids': docs.get_column("doc_id").cast(pl.String).to_list()}
 	temp_metadata_target['tags_ds'] = {'tags': sorted(ds_tags)}
 	temp_metadata_target['tags_pos'] = {'tags': sorted(tags_pos)}
 	temp_metadata_target['doccats'] = {'cats': ''}
@@ -119,6 +122,7 @@ def init_metadata_target(session_id):
 
 def init_metadata_reference(session_id):
 	df = st.session_state[session_id]["reference"]["ds_tokens"]
+	docs = st.session_state[session_id]["reference"]["docs"]
 	tags_to_check = df.get_column("ds_tag").to_list()
 	tags = ['Actors', 'Organization', 'Planning', 'Sentiment', 'Signposting', 'Stance']
 	if any(tag in item for item in tags_to_check for tag in tags):
@@ -132,12 +136,12 @@ def init_metadata_reference(session_id):
 	if "Y" in tags_pos:
 		tags_pos.remove("Y")
 	temp_metadata_reference = {}
-	temp_metadata_reference['tokens_pos'] = df.group_by(["doc_id", "pos_id", "pos_tag"]).agg(pl.col("token").str.concat("")).filter(pl.col("pos_tag") != "Y").height
-	temp_metadata_reference['tokens_ds'] = df.group_by(["doc_id", "ds_id", "ds_tag"]).agg(pl.col("token").str.concat("")).filter(~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged"))).height
-	temp_metadata_reference['ndocs'] = len(df.get_column("doc_id").unique().to_list())
+	temp_metadata_reference['tokens_pos'] = docs.get_column("tokens_pos").sum()
+	temp_metadata_reference['tokens_ds'] = docs.get_column("tokens_ds").sum()
+	temp_metadata_reference['ndocs'] = docs.height
 	temp_metadata_reference['model'] = model
 	temp_metadata_reference['doccats'] = False
-	temp_metadata_reference['docids'] = {'ids': sorted(df.get_column("doc_id").unique().to_list())}
+	temp_metadata_reference['docids'] = {'ids': docs.get_column("doc_id").cast(pl.String).to_list()}
 	temp_metadata_reference['tags_ds'] = {'tags': sorted(ds_tags)}
 	temp_metadata_reference['tags_pos'] = {'tags': sorted(tags_pos)}
 
@@ -191,44 +195,17 @@ def load_corpus_internal(db_path, session_id, corpus_type='target'):
 			except:
 				pass	
 	else:
-		for key, value in data.items():
-			if key not in st.session_state[session_id][corpus_type]:
-				st.session_state[session_id][corpus_type][key] = {}
-			st.session_state[session_id][corpus_type][key] = value
-
-def load_corpus_new(ds_tokens,
-					dtm_ds,
-					dtm_pos,
-					ft_ds,
-					ft_pos,
-					tt_ds,
-					tt_pos,
-					session_id, 
-					corpus_type='target'):
+		if "ds_tokens" in data:
+			data.update(_process.build_corpus_store(_process.encode_tags_pl(data["ds_tokens"])))
+		load_corpus_new(data, session_id, corpus_type)
 
+def load_corpus_new(corpus_store, session_id, corpus_type='target'):
 	if corpus_type not in st.session_state[session_id]:
 		st.session_state[session_id][corpus_type] = {}
-	if "ds_tokens" not in st.session_state[session_id][corpus_type]:
-		st.session_state[session_id][corpus_type]["ds_tokens"] = {}
-	st.session_state[session_id][corpus_type]["ds_tokens"] = ds_tokens
-	if "dtm_ds" not in st.session_state[session_id][corpus_type]:
-		st.session_state[session_id][corpus_type]["dtm_ds"] = {}
-	st.session_state[session_id][corpus_type]["dtm_ds"] = dtm_ds
-	if "dtm_pos" not in st.session_state[session_id][corpus_type]:
-		st.session_state[session_id][corpus_type]["dtm_pos"] = {}
-	st.session_state[session_id][corpus_type]["dtm_pos"] = dtm_pos
-	if "ft_ds" not in st.session_state[session_id][corpus_type]:
-		st.session_state[session_id][corpus_type]["ft_ds"] = {}
-	st.session_state[session_id][corpus_type]["ft_ds"] = ft_ds	
-	if "ft_pos" not in st.session_state[session_id][corpus_type]:
-		st.session_state[session_id][corpus_type]["ft_pos"] = {}
-	st.session_state[session_id][corpus_type]["ft_pos"] = ft_pos	
-	if "tt_ds" not in st.session_state[session_id][corpus_type]:
-		st.session_state[session_id][corpus_type]["tt_ds"] = {}
-	st.session_state[session_id][corpus_type]["tt_ds"] = tt_ds	
-	if "tt_pos" not in st.session_state[session_id][corpus_type]:
-		st.session_state[session_id][corpus_type]["tt_pos"] = {}
-	st.session_state[session_id][corpus_type]["tt_pos"] = tt_pos
+	for key, value in corpus_store.items():
+		if key not in st.session_state[session_id][corpus_type]:
+			st.session_state[session_id][corpus_type][key] = {}
+		st.session_state[session_id][corpus_type][key] = value
 
 def find_saved(model_type: str):
 	SUB_DIR = CORPUS_DIR.joinpath(model_type)
@@ -327,16 +304,15 @@ def convert_corpus_to_zip(session_id, corpus_type, file_type="parquet"):
 	processed_data = zip_buf.getvalue()
 	return(processed_data)
 
-def convert_to_zip(tok_pl, tagset):
+def convert_to_zip(pos_units, ds_units, tagset):
 	zip_buf = BytesIO()
 	with zipfile.ZipFile(zip_buf, 'w', zipfile.ZIP_DEFLATED) as file_zip:
-		for id in tok_pl.get_column("doc_id").unique().to_list():
+		for id in pos_units.get_column("doc_id").unique().to_list():
 				if tagset == "pos":
 					df = (
-						tok_pl
+						pos_units
 						.filter(pl.col("doc_id") == id)
-						.group_by(["pos_id", "pos_tag"], maintain_order = True)
-						.agg(pl.col("token").str.concat(""))
+						.with_columns(pl.col("pos_tag").cast(pl.String))
 						.with_columns(pl.col("token").str.strip_chars())
 						.with_columns(pl.col("token").str.replace_all(" ", "_"))
 						.with_columns(pl.when(pl.col("pos_tag") == "Y").then(pl.col("pos_tag").str.replace("Y", "", literal=True))
@@ -347,10 +323,9 @@ def convert_to_zip(tok_pl, tagset):
 						)
 				else:
 					df = (
-						tok_pl
+						ds_units
 						.filter(pl.col("doc_id") == id)
-						.group_by(["ds_id", "ds_tag"], maintain_order = True)
-						.agg(pl.col("token").str.concat(""))
+						.with_columns(pl.col("ds_tag").cast(pl.String))
 						.with_columns(pl.col("token").str.strip_chars())
 						.with_columns(pl.col("token").str.replace_all(" ", "_"))
 						.with_columns(pl.when(pl.col("ds_tag") == "Untagged")
@@ -29,6 +29,10 @@ def import_options_load(options_path):
 		options['global']['enable_save'] = False
 		options['global']['desktop_mode'] = False
 		options['global']['max_bytes'] = 0
+		options['global']['n_process'] = 1
+		options['global']['batch_size'] = 25
+		options['global']['enable_cache'] = True
+		options['global']['cache_max_bytes'] = 500000000
 
 	# language can't be checked on Windows so toggle off.
 	if options['global']['check_language'] == True and (sys.platform == "win" or sys.platform == "cygwin"):
@@ -56,6 +60,10 @@ def import_options_general(options_path):
 		options['global']['enable_save'] = False
 		options['global']['desktop_mode'] = False
 		options['global']['max_bytes'] = 0
+		options['global']['n_process'] = 1
+		options['global']['batch_size'] = 25
+		options['global']['enable_cache'] = True
+		options['global']['cache_max_bytes'] = 500000000
 
 	return(options)
 			
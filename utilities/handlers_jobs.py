@@ -0,0 +1,131 @@
+# Copyright (C) 2024 David West Brown
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import os
+import pathlib
+import shutil
+import threading
+import time
+
+import polars as pl
+
+from utilities import handlers_cache as _cache
+from utilities import process_corpus as _process
+
+HERE = pathlib.Path(__file__).parents[1].resolve()
+JOBS_DIR = HERE.joinpath("_jobs")
+
+# Functions for running corpus processing as background jobs.
+# A job runs the processing pipeline on its own thread, so the app can poll its progress between reruns.
+# Each finished document is written to _jobs/<dir_id>/<doc_id>.parquet as soon as it comes back.
+# The directory id is a hash of the model, the language check and the uploaded files,
+# so submitting the same upload again resumes an interrupted job from the documents already on disk.
+# Jobs themselves belong to a session: the job id joins the session id to the directory id,
+# so sessions that upload the same files share the directory but not the job, and one cannot cancel or collect another's.
+# A directory is removed when the last job holding it is collected; directories left by abandoned jobs are evicted by age.
+
+JOBS = {}
+JOBS_LOCK = threading.Lock()
+
+def job_key(corp, nlp_model, detect_language=None):
+	job_hash = hashlib.sha256()
+	job_hash.update(_cache.model_key(nlp_model).encode('utf-8'))
+	job_hash.update(str(detect_language).encode('utf-8'))
+	for doc in sorted(corp, key=lambda doc: doc.name):
+		job_hash.update(doc.name.encode('utf-8'))
+		job_hash.update(hashlib.sha256(doc.getvalue()).digest())
+	return job_hash.hexdigest()[:16]
+
+def dir_holders(dir_id):
+	return [job_id for job_id, job in JOBS.items() if job['dir_id'] == dir_id]
+
+def run_job(job, corp, nlp_model, detect_model, detect_language, pipeline_args):
+	job_dir = JOBS_DIR.joinpath(job['dir_id'])
+	try:
+		os.makedirs(job_dir, exist_ok=True)
+		done_ids = set([path.stem for path in job_dir.glob("*.parquet")])
+		job['done'] = len(done_ids)
+		todo = [doc for doc in corp if _process.get_doc_id(doc.name) not in done_ids]
+		doc_stream = _process.stream_corpus(todo, nlp_model, job['exceptions'], detect_model, detect_language, **pipeline_args)
+		for doc_id, doc_tags in doc_stream:
+			path = job_dir.joinpath(doc_id + ".parquet")
+			# another session's job may be writing the same document into a shared directory
+			tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+			doc_tags.write_parquet(tmp_path)
+			os.replace(tmp_path, path)
+			job['done'] += 1
+			if job['cancel'].is_set():
+				doc_stream.close()
+				job['status'] = 'cancelled'
+				return
+		job['status'] = 'done'
+	except Exception as e:
+		job['error'] = str(e)
+		job['status'] = 'failed'
+
+def submit_job(session_id, corp, nlp_model, detect_model=None, detect_language=None, max_age=0, **pipeline_args):
+	dir_id = job_key(corp, nlp_model, detect_language)
+	job_id = f"{session_id}-{dir_id}"
+	with JOBS_LOCK:
+		evict_jobs(max_age)
+		if job_id in JOBS and JOBS[job_id]['status'] in ['running', 'done']:
+			return job_id
+		job = {'job_id': job_id, 'dir_id': dir_id, 'status': 'running', 'done': 0, 'total': len(corp), 'exceptions': [], 'error': None, 'cancel': threading.Event()}
+		JOBS[job_id] = job
+	thread = threading.Thread(target=run_job, args=(job, list(corp), nlp_model, detect_model, detect_language, pipeline_args), daemon=True)
+	thread.start()
+	return job_id
+
+def job_status(job_id):
+	job = JOBS.get(job_id)
+	if job is None:
+		return(None)
+	progress = min((job['done'] + len(job['exceptions'])) / max(job['total'], 1), 1.0)
+	return {'status': job['status'], 'done': job['done'], 'total': job['total'], 'progress': progress, 'error': job['error']}
+
+def cancel_job(job_id):
+	job = JOBS.get(job_id)
+	if job is not None:
+		job['cancel'].set()
+
+# Gather the documents of a finished job into ds_tokens and drop the job.
+# The directory is removed only when no other job holds it. Returns None for a job that no longer exists.
+def collect_job(job_id):
+	with JOBS_LOCK:
+		job = JOBS.pop(job_id, None)
+		if job is None:
+			return(None)
+		job_dir = JOBS_DIR.joinpath(job['dir_id'])
+		ds_tokens = _process.polars_sink((path.stem, pl.read_parquet(path)) for path in job_dir.glob("*.parquet"))
+		if len(dir_holders(job['dir_id'])) == 0:
+			shutil.rmtree(job_dir, ignore_errors=True)
+	return ds_tokens, job['exceptions']
+
+# Remove job directories that no job holds and that have not been written to for max_age seconds,
+# such as those left by cancelled, failed or abandoned jobs. Called with JOBS_LOCK held.
+def evict_jobs(max_age):
+	if max_age is None or max_age <= 0 or not JOBS_DIR.exists():
+		return
+	held = set([job['dir_id'] for job in JOBS.values()])
+	now = time.time()
+	for job_dir in JOBS_DIR.iterdir():
+		if not job_dir.is_dir() or job_dir.name in held:
+			continue
+		try:
+			last_write = max([path.stat().st_mtime for path in job_dir.iterdir()] + [job_dir.stat().st_mtime])
+		except:
+			continue
+		if now - last_write > max_age:
+			shutil.rmtree(job_dir, ignore_errors=True)
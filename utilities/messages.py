@@ -128,7 +128,8 @@ message_load_target_internal = """
 
 message_load_target_external = """
     :point_down: Use the widget to select the corpus you'd like to load, either by browsing for them or dragging-and-dropping.\n
-    :trackball: Once you've selected your file, click the **UPLOAD** button and a processing button will appear in the sidebar.
+    :trackball: Once you've selected your file, click the **UPLOAD** button and a processing button will appear in the sidebar.\n
+    :card_index_dividers: A corpus saved in several parts (like the shards written by `batch_tagger.py`) can be loaded by selecting all of its files.
     """
 
 message_load_target_new = """
@@ -171,13 +172,15 @@ message_collocations = """
 	* You can input a word (without any spaces) and return collocates and their part-of-speech tags.
 	* You can also adjust the span (to left or right) of your node word.
 	* You can choose to **anchor** your node word by a tag (e.g. specifying *can* as a **modal verb** or as **hedged confidence**).
-	* You can choose from among 4 different association measures.
+	* You can enter a list of node words (one per line) to return the collocates of all of them in a single table.
+	* You can sort the table by any of 7 different association measures.
 	"""
 
 message_kwic = """
 	:point_left: Use this tool to generate Key Words in Context for a word or part of a word (like the ending *tion*).\n
 	* Note that wildcard characters are **not needed**.
 	* Instead specify if you want a word to start with, end with, or include a string.
+	* For more complex searches, choose **Wildcard** (where * matches any characters and ? matches one character) or **Regex** (a regular expression).
 	"""
 
 message_keyness = """
@@ -202,7 +205,8 @@ message_corpus_parts = """
 	```
 	BIO, ENG, HIS
 	```
-	* Those categories could then be compared in any combination.\n
+	* Those categories could then be compared in any combination.
+	* Alternatively, select **Every category** to compare each category against the rest of the corpus (and, optionally, each pair of categories) in one run.\n
 	:lock: Selecting of the same category as target and reference is prevented.
 	"""
 
@@ -302,14 +306,18 @@ message_association_measures = """
 	
 	This can be handled by filtering for minimum frequencies and MI scores.
 	Alternatively, [other measures have been proposed, which you can select from here.](https://en.wikipedia.org/wiki/Pointwise_mutual_information)
+
+	The table also includes [log-likelihood](https://ucrel.lancs.ac.uk/llwizard.html) (LL), the t-score and [logDice](https://www.sketchengine.eu/documentation/statistics-used-in-sketch-engine/).
+	LL and the t-score favor frequent collocates, while logDice is a scaled measure that does not depend on the size of the corpus.
+	Choosing a different statistic re-sorts the table.
 	"""
 
 message_columns_collocations = """
 	The **Freq Span** columns refers to the collocate's frequency within the given window,
 	while **Freq Total** refers to its overall frequency in the corpus. 
 	Note that is possible for a collocate to have a *higher* frequency within a window, than a total frequency.\n
-	The **MI** column refers to the association measure selected when the table was generated
-	(one of NPMI, PMI2, PMI3, or PMI).
+	The remaining columns are the association measures (PMI, NPMI, PMI 2, PMI 3, LL, T Score and Log Dice).
+	The table is sorted by the one selected.
 	"""
 
 message_columns_keyness = """
@@ -318,6 +326,8 @@ message_columns_keyness = """
 	Note that a negative value means that the token is more frequent in the reference corpus than the target.\n
 	**LR** refers to [Log-Ratio](http://cass.lancs.ac.uk/log-ratio-an-informal-introduction/), which is an [effect size](https://www.scribbr.com/statistics/effect-size/).
 	And **PV** refers to the [p-value](https://scottbot.net/friends-dont-let-friends-calculate-p-values-without-fully-understanding-them/).\n
+	**%DIFF** is the percentage difference between the normalized frequencies, and **OR** is the odds ratio, both effect sizes.
+	**BIC** approximates the Bayes factor: values above 2 are positive evidence of a difference, above 6 strong, and above 10 very strong.\n
 	The **AF** columns refer to the absolute frequencies in the target and reference.
 	The **RF** columns refer to the relative frequencies (normalized **per million for tokens** and **per 100 for tags**).
 	Note that for part-of-speech tags, tokens are normalized against word tokens,
@@ -13,41 +13,43 @@
 # limitations under the License.
 
 from collections import OrderedDict
+import itertools
 import math
+import numpy as np
 import os
 import polars as pl
-import random
 import re
 import string
 import unidecode
 
-def check_language(text_str, detect_model, detect_language):
+from utilities import analysis_functions as _analysis
+from utilities import handlers_cache as _cache
+
+# Sample offsets are taken from a hash of the text, so the same file always gets the same verdict.
+def sample_text(text_str):
 	doc_len = len(text_str)
-	predictions = []
 	if doc_len > 5000:
-		idx_a = random.randint(0, doc_len - 1500)
-		idx_b = random.randint(0, doc_len - 1500)
-		idx_c = random.randint(0, doc_len - 1500)
-		sample_a = text_str[idx_a:idx_a + 1000]
-		sample_a = " ".join(sample_a.split())
-		sample_b = text_str[idx_b:idx_b + 1000]
-		sample_b = " ".join(sample_b.split())
-		sample_c = text_str[idx_c:idx_c + 1000]
-		sample_c = " ".join(sample_c.split())
-		text_sample = [sample_a, sample_b, sample_c]
-		#get prediction for each chunk
-		for chunk in text_sample:  # Language predict each sampled chunk
-			value = detect_model.compute_language_confidence(chunk, detect_language)
-			predictions.append(value)
+		seed = int(_cache.text_key(text_str), 16)
+		sample_idx = [(seed >> (64*i)) % (doc_len - 1499) for i in range(3)]
+		return [" ".join(text_str[idx:idx + 1000].split()) for idx in sample_idx]
 	else:
-		text_str = " ".join(text_str.split())
-		value = detect_model.compute_language_confidence(text_str, detect_language)
-		predictions.append(value)
-		
-	confidence = sum(predictions) / len(predictions)
+		return [" ".join(text_str.split())]
 
-	# Only want to know if this is english or not.
-	return confidence > .9
+# Score the samples of all documents in one call, which lingua spreads across threads.
+def check_languages(texts, detect_model, detect_language):
+	text_samples = [sample_text(text_str) for text_str in texts]
+	predictions = detect_model.compute_language_confidence_in_parallel([chunk for samples in text_samples for chunk in samples], detect_language)
+	verdicts = []
+	idx = 0
+	for samples in text_samples:
+		confidence = sum(predictions[idx:idx + len(samples)]) / len(samples)
+		idx += len(samples)
+		# Only want to know if this is english or not.
+		verdicts.append(confidence > .9)
+	return verdicts
+
+def check_language(text_str, detect_model, detect_language):
+	return check_languages([text_str], detect_model, detect_language)[0]
 
 def pre_process(txt):
 	txt = re.sub(r'\bits\b', 'it s', txt)
@@ -55,140 +57,212 @@ def pre_process(txt):
 	txt = " ".join(txt.split())
 	return(txt)
 
-def process_corpus(corp, nlp_model):
-	is_punct = re.compile("[{}]+\s*$".format(re.escape(string.punctuation)))
-	is_digit = re.compile("\d[\d{}]*\s*$".format(re.escape(string.punctuation)))
-	tp = {}
-	exceptions = []
-	for doc in corp:
+PUNCT_PATTERN = r"^[{}]+\s*$".format(re.escape(string.punctuation))
+DIGIT_PATTERN = r"^\d[\d{}]*\s*$".format(re.escape(string.punctuation))
+SENTENCE_BREAK = re.compile(r'[\.\?!] [A-Z]')
+WORD_BREAK = re.compile(' ')
+IOB_CODES = {0: "", 1: "I", 2: "O", 3: "B"}
+DS_TOKENS_SCHEMA = OrderedDict([('doc_id', pl.String), ('token', pl.String), ('pos_tag', pl.Categorical), ('ds_tag', pl.Categorical), ('pos_id', pl.UInt32), ('ds_id', pl.UInt32)])
+TAG_COLUMNS = ["pos_tag", "ds_tag"]
+LEXICON_COLUMNS = ["pos_lex", "ds_lex"]
+
+# Tag columns are dictionary-encoded as Categoricals, so groupings and comparisons on tags work on integer codes.
+# The global string cache keeps the codes consistent across corpora, so target and reference tables can be joined and stacked.
+pl.enable_string_cache()
+
+# Read a tagged Doc column by column: tag and entity hashes are resolved once per distinct value.
+def doc_tags_pl(doc_taged):
+	attrs = doc_taged.to_array(["TAG", "ENT_IOB", "ENT_TYPE"])
+	strings = doc_taged.vocab.strings
+	tag_hashes = pl.Series(np.unique(attrs[:, 0]), dtype=pl.UInt64)
+	ent_hashes = pl.Series(np.unique(attrs[:, 2]), dtype=pl.UInt64)
+	df = (
+		pl.DataFrame({
+			"token": [token.text_with_ws for token in doc_taged],
+			"tag": attrs[:, 0],
+			"iob": attrs[:, 1],
+			"ent": attrs[:, 2]
+			}, schema_overrides={"token": pl.String})
+		.select(
+			pl.col("token"),
+			pl.col("tag").replace_strict(tag_hashes, [strings[h] for h in tag_hashes], return_dtype=pl.String).alias("pos_tag"),
+			pl.concat_str([
+				pl.col("iob").replace_strict(IOB_CODES, return_dtype=pl.String),
+				pl.col("ent").replace_strict(ent_hashes, [strings[h] for h in ent_hashes], return_dtype=pl.String)
+				], separator="-").alias("ds_tag")
+			)
+		.with_columns(
+			pl.when(pl.col("token").str.contains(PUNCT_PATTERN))
+			.then(pl.lit("Y"))
+			.when(pl.col("token").str.contains(DIGIT_PATTERN))
+			.then(pl.lit("MC"))
+			.otherwise(pl.col("pos_tag"))
+			.alias("pos_tag")
+		)
+	)
+	return(df)
+
+# Unit ids in the returned table start at 1; stack_docs_pl makes them corpus-wide.
+def doc_to_pl(doc_tags, doc_id):
+	df = doc_tags.select(pl.lit(doc_id, dtype=pl.String).alias("doc_id"), pl.all())
+	return(assign_ids_pl(df))
+
+# Split points are found by searching from each nominal offset rather than slicing off the rest of the text.
+def split_doc(doc_txt):
+	doc_len = len(doc_txt)
+	n_chunks = math.ceil(doc_len/750000)
+	chunk_idx = [math.ceil(i/n_chunks*doc_len) for i in range(1, n_chunks)]
+	try:
+		split_idx = [SENTENCE_BREAK.search(doc_txt, idx).end() - 1 for idx in chunk_idx]
+	except:
 		try:
-			doc_txt = doc.getvalue().decode('utf-8')
+			split_idx = [WORD_BREAK.search(doc_txt, idx).start() for idx in chunk_idx]
 		except:
-			exceptions.append(doc.name)
-		else:
-			doc_txt = unidecode.unidecode(doc_txt)
-			doc_id = doc.name.replace(" ", "")
-			doc_id = str(os.path.splitext(doc_id)[0])
-			doc_txt = pre_process(doc_txt)
-			doc_len = len(doc_txt)
-			if doc_len > 1000000:
-				n_chunks = math.ceil(doc_len/750000)
-				chunk_idx = [math.ceil(i/n_chunks*doc_len) for i in range(1, n_chunks)]
-				try:
-					split_idx = [re.search('[\.\?!] [A-Z]', doc_txt[idx:]).span()[1] + (idx-1) for idx in chunk_idx]
-				except:
-					try:
-						split_idx = [re.search(' ', doc_txt[idx:]).span()[0] + idx for idx in chunk_idx]
-					except:
-						exceptions.append(doc.name)
-				else:
-					split_idx.insert(0, 0)
-					doc_chunks = [doc_txt[i:j] for i, j in zip(split_idx, split_idx[1:]+[None])]
-					token_list = []
-					tag_list = []
-					iob_ent = []
-					for chunk in doc_chunks:
-						chunk_taged = nlp_model(chunk)
-						token_chunk = [token.text for token in chunk_taged]
-						ws_chunk = [token.whitespace_ for token in chunk_taged]
-						token_chunk = list(map(''.join, zip(token_chunk, ws_chunk)))
-						iob_chunk = [token.ent_iob_ for token in chunk_taged]
-						ent_chunk = [token.ent_type_ for token in chunk_taged]
-						iob_ent_chunk = list(map('-'.join, zip(iob_chunk, ent_chunk)))
-						tag_chunk = [token.tag_ for token in chunk_taged]
-						tag_chunk = ['Y' if bool(is_punct.match(token_chunk[i])) else v for i, v in enumerate(tag_chunk)]
-						tag_chunk = ['MC' if bool(is_digit.match(token_chunk[i])) and tag_chunk[i] != 'Y' else v for i, v in enumerate(tag_chunk)]
-						token_list.append(token_chunk)
-						tag_list.append(tag_chunk)
-						iob_ent.append(iob_ent_chunk)
-					token_list = [item for sublist in token_list for item in sublist]
-					tag_list = [item for sublist in tag_list for item in sublist]
-					iob_ent = [item for sublist in iob_ent for item in sublist]
-					tp.update({doc_id: (list(zip(token_list, tag_list, iob_ent)))})
-			else:
-				doc_taged = nlp_model(doc_txt)
-				token_list = [token.text for token in doc_taged]
-				ws_list = [token.whitespace_ for token in doc_taged]
-				token_list = list(map(''.join, zip(token_list, ws_list)))
-				iob_list = [token.ent_iob_ for token in doc_taged]
-				ent_list = [token.ent_type_ for token in doc_taged]
-				iob_ent = list(map('-'.join, zip(iob_list, ent_list)))
-				tag_list = [token.tag_ for token in doc_taged]
-				tag_list = ['Y' if bool(is_punct.match(token_list[i])) else v for i, v in enumerate(tag_list)]
-				tag_list = ['MC' if bool(is_digit.match(token_list[i])) and tag_list[i] != 'Y' else v for i, v in enumerate(tag_list)]
-				tp.update({doc_id: (list(zip(token_list, tag_list, iob_ent)))})
-				tp = dict(sorted(tp.items()))
-	return tp, exceptions
+			return(None)
+	split_idx.insert(0, 0)
+	doc_chunks = [doc_txt[i:j] for i, j in zip(split_idx, split_idx[1:]+[None])]
+	return(doc_chunks)
 
-def process_corpus_detect(corp, nlp_model, detect_model, detect_language):
-	is_punct = re.compile("[{}]+\s*$".format(re.escape(string.punctuation)))
-	is_digit = re.compile("\d[\d{}]*\s*$".format(re.escape(string.punctuation)))
-	tp = {}
-	exceptions = []
+# The processing pipeline is a chain of generators, each handling one document at a time:
+# read_docs (decode) -> filter_language (optional) -> normalize_docs -> tag_corpus (tag and extract).
+# stream_corpus strings the stages together, and a sink consumes the (doc_id, tags) pairs it yields.
+# Names of documents that are dropped along the way are appended to exceptions.
+
+def read_docs(corp, exceptions):
 	for doc in corp:
 		try:
 			doc_txt = doc.getvalue().decode('utf-8')
 		except:
 			exceptions.append(doc.name)
 		else:
-			doc_txt = unidecode.unidecode(doc_txt)
-			is_english = check_language(doc_txt, detect_model, detect_language)
-			if is_english == False:
-				exceptions.append(doc.name)
+			yield unidecode.unidecode(doc_txt), doc.name
+
+# Documents are scored batch_size at a time so that lingua can work on several at once.
+def filter_language(texts, exceptions, detect_model, detect_language, use_cache=False, batch_size=25):
+	texts = iter(texts)
+	while True:
+		batch = list(itertools.islice(texts, batch_size))
+		if len(batch) == 0:
+			break
+		verdicts = [_cache.load_verdict(detect_language, doc_txt) if use_cache else None for doc_txt, doc_name in batch]
+		unchecked = [i for i, verdict in enumerate(verdicts) if verdict is None]
+		for i, verdict in zip(unchecked, check_languages([batch[i][0] for i in unchecked], detect_model, detect_language)):
+			verdicts[i] = verdict
+			if use_cache:
+				_cache.save_verdict(detect_language, batch[i][0], verdict)
+		for (doc_txt, doc_name), verdict in zip(batch, verdicts):
+			if verdict == True:
+				yield doc_txt, doc_name
+			else:
+				exceptions.append(doc_name)
+
+def get_doc_id(doc_name):
+	doc_id = doc_name.replace(" ", "")
+	doc_id = str(os.path.splitext(doc_id)[0])
+	return(doc_id)
+
+def normalize_docs(texts):
+	for doc_txt, doc_name in texts:
+		yield pre_process(doc_txt), doc_name, get_doc_id(doc_name)
+
+# Tag documents in batches with nlp.pipe, which can fan out across worker processes.
+# The stream is read batch_size documents at a time: those found in the tagging cache (with use_cache)
+# are passed on at once, and only the rest of the batch is piped.
+# Documents over 1,000,000 characters are set aside and tagged last: they are split into chunks that are piped
+# one per batch, so the chunks of a single document are spread across workers, and stitched back together in order.
+def tag_corpus(docs, exceptions, nlp_model, n_process=1, batch_size=25, use_cache=False, cache_max_bytes=0):
+	docs = iter(docs)
+	long_docs = []
+	while True:
+		batch = list(itertools.islice(docs, batch_size))
+		if len(batch) == 0:
+			break
+		short_docs = []
+		for doc_txt, doc_name, doc_id in batch:
+			doc_tags = _cache.load_cached(nlp_model, doc_txt) if use_cache else None
+			if doc_tags is not None:
+				yield doc_id, doc_tags
+			elif len(doc_txt) > 1000000:
+				long_docs.append((doc_txt, doc_name, doc_id))
 			else:
-				doc_id = doc.name.replace(" ", "")
-				doc_id = str(os.path.splitext(doc_id)[0])
-				doc_txt = pre_process(doc_txt)
-				doc_len = len(doc_txt)
-				if doc_len > 1000000:
-					n_chunks = math.ceil(doc_len/750000)
-					chunk_idx = [math.ceil(i/n_chunks*doc_len) for i in range(1, n_chunks)]
-					try:
-						split_idx = [re.search('[\.\?!] [A-Z]', doc_txt[idx:]).span()[1] + (idx-1) for idx in chunk_idx]
-					except:
-						try:
-							split_idx = [re.search(' ', doc_txt[idx:]).span()[0] + idx for idx in chunk_idx]
-						except:
-							exceptions.append(doc.name)
-					else:
-						split_idx.insert(0, 0)
-						doc_chunks = [doc_txt[i:j] for i, j in zip(split_idx, split_idx[1:]+[None])]
-						token_list = []
-						tag_list = []
-						iob_ent = []
-						for chunk in doc_chunks:
-							chunk_taged = nlp_model(chunk)
-							token_chunk = [token.text for token in chunk_taged]
-							ws_chunk = [token.whitespace_ for token in chunk_taged]
-							token_chunk = list(map(''.join, zip(token_chunk, ws_chunk)))
-							iob_chunk = [token.ent_iob_ for token in chunk_taged]
-							ent_chunk = [token.ent_type_ for token in chunk_taged]
-							iob_ent_chunk = list(map('-'.join, zip(iob_chunk, ent_chunk)))
-							tag_chunk = [token.tag_ for token in chunk_taged]
-							tag_chunk = ['Y' if bool(is_punct.match(token_chunk[i])) else v for i, v in enumerate(tag_chunk)]
-							tag_chunk = ['MC' if bool(is_digit.match(token_chunk[i])) and tag_chunk[i] != 'Y' else v for i, v in enumerate(tag_chunk)]
-							token_list.append(token_chunk)
-							tag_list.append(tag_chunk)
-							iob_ent.append(iob_ent_chunk)
-						token_list = [item for sublist in token_list for item in sublist]
-						tag_list = [item for sublist in tag_list for item in sublist]
-						iob_ent = [item for sublist in iob_ent for item in sublist]
-						tp.update({doc_id: (list(zip(token_list, tag_list, iob_ent)))})
-				else:
-					doc_taged = nlp_model(doc_txt)
-					token_list = [token.text for token in doc_taged]
-					ws_list = [token.whitespace_ for token in doc_taged]
-					token_list = list(map(''.join, zip(token_list, ws_list)))
-					iob_list = [token.ent_iob_ for token in doc_taged]
-					ent_list = [token.ent_type_ for token in doc_taged]
-					iob_ent = list(map('-'.join, zip(iob_list, ent_list)))
-					tag_list = [token.tag_ for token in doc_taged]
-					tag_list = ['Y' if bool(is_punct.match(token_list[i])) else v for i, v in enumerate(tag_list)]
-					tag_list = ['MC' if bool(is_digit.match(token_list[i])) and tag_list[i] != 'Y' else v for i, v in enumerate(tag_list)]
-					tp.update({doc_id: (list(zip(token_list, tag_list, iob_ent)))})
-					tp = dict(sorted(tp.items()))
+				short_docs.append((doc_txt, (doc_txt, doc_id)))
+		if len(short_docs) == 0:
+			continue
+		for doc_taged, (doc_txt, doc_id) in nlp_model.pipe(short_docs, as_tuples=True, n_process=n_process, batch_size=batch_size):
+			doc_tags = doc_tags_pl(doc_taged)
+			if use_cache:
+				_cache.save_cached(nlp_model, doc_txt, doc_tags)
+			yield doc_id, doc_tags
+	long_chunks = []
+	for doc_txt, doc_name, doc_id in long_docs:
+		doc_chunks = split_doc(doc_txt)
+		if doc_chunks is None:
+			exceptions.append(doc_name)
+		else:
+			long_chunks.extend([(chunk, (doc_txt, doc_id, len(doc_chunks))) for chunk in doc_chunks])
+	if len(long_chunks) > 0:
+		chunk_tags = []
+		for chunk_taged, (doc_txt, doc_id, n_chunks) in nlp_model.pipe(long_chunks, as_tuples=True, n_process=n_process, batch_size=1):
+			chunk_tags.append(doc_tags_pl(chunk_taged))
+			if len(chunk_tags) == n_chunks:
+				doc_tags = pl.concat(chunk_tags)
+				chunk_tags = []
+				if use_cache:
+					_cache.save_cached(nlp_model, doc_txt, doc_tags)
+				yield doc_id, doc_tags
+	if use_cache:
+		_cache.evict_cache(cache_max_bytes)
+
+def stream_corpus(corp, nlp_model, exceptions, detect_model=None, detect_language=None, n_process=1, batch_size=25, use_cache=False, cache_max_bytes=0):
+	texts = read_docs(corp, exceptions)
+	if detect_model is not None:
+		texts = filter_language(texts, exceptions, detect_model, detect_language, use_cache=use_cache, batch_size=batch_size)
+	docs = normalize_docs(texts)
+	return tag_corpus(docs, exceptions, nlp_model, n_process=n_process, batch_size=batch_size, use_cache=use_cache, cache_max_bytes=cache_max_bytes)
+
+# Sinks: documents arrive in processing order and are sorted by doc_id once at the end.
+
+def tuples_sink(doc_stream):
+	tp = {doc_id: doc_tags.rows() for doc_id, doc_tags in doc_stream}
+	return dict(sorted(tp.items()))
+
+def polars_sink(doc_stream):
+	tok_pl = {doc_id: doc_to_pl(doc_tags, doc_id) for doc_id, doc_tags in doc_stream}
+	return stack_docs_pl([tok_pl[doc_id] for doc_id in sorted(tok_pl)])
+
+# Write ds_tokens in shards of shard_size documents; each shard is a complete ds_tokens table with ids starting at 1.
+def parquet_sink(doc_stream, out_dir, shard_size=1000):
+	os.makedirs(out_dir, exist_ok=True)
+	shards = []
+	tok_pl = {}
+	def write_shard():
+		shard = stack_docs_pl([tok_pl[doc_id] for doc_id in sorted(tok_pl)])
+		path = os.path.join(out_dir, f"part-{len(shards):05d}.parquet")
+		shard.write_parquet(path)
+		shards.append(path)
+		tok_pl.clear()
+	for doc_id, doc_tags in doc_stream:
+		tok_pl[doc_id] = doc_to_pl(doc_tags, doc_id)
+		if len(tok_pl) >= shard_size:
+			write_shard()
+	if len(tok_pl) > 0:
+		write_shard()
+	return shards
+
+def process_corpus(corp, nlp_model, detect_model=None, detect_language=None, n_process=1, batch_size=25, use_cache=False, cache_max_bytes=0):
+	exceptions = []
+	tp = tuples_sink(stream_corpus(corp, nlp_model, exceptions, detect_model, detect_language, n_process=n_process, batch_size=batch_size, use_cache=use_cache, cache_max_bytes=cache_max_bytes))
 	return tp, exceptions
 
+def process_corpus_detect(corp, nlp_model, detect_model, detect_language, n_process=1, batch_size=25, use_cache=False, cache_max_bytes=0):
+	return process_corpus(corp, nlp_model, detect_model, detect_language, n_process=n_process, batch_size=batch_size, use_cache=use_cache, cache_max_bytes=cache_max_bytes)
+
+# Tag straight into a ds_tokens table without building the intermediate dictionary of tuples.
+def process_corpus_pl(corp, nlp_model, detect_model=None, detect_language=None, n_process=1, batch_size=25, use_cache=False, cache_max_bytes=0):
+	exceptions = []
+	ds_tokens = polars_sink(stream_corpus(corp, nlp_model, exceptions, detect_model, detect_language, n_process=n_process, batch_size=batch_size, use_cache=use_cache, cache_max_bytes=cache_max_bytes))
+	return ds_tokens, exceptions
+
 def get_corpus_features(ibis_conn):
 	df = ibis_conn.table('ds_tokens').to_polars()
 	tags_pos = df["pos_tag"].unique().to_list().remove("Y")
@@ -227,9 +301,14 @@ def check_corpus(docs, check_size=False, check_ref=False, target_docs=None):
 	else:
 		return(dup_ids)
 
+# Older corpora and uploads store tags as plain strings; those are accepted and encoded with encode_tags_pl.
+# Lexicon ids saved with a downloaded corpus are ignored here, as they are rebuilt by encode_lexicon_pl.
 def check_schema(tok_pl):
-	validation = OrderedDict([('doc_id', pl.String), ('token', pl.String), ('pos_tag', pl.String), ('ds_tag', pl.String), ('pos_id', pl.UInt32), ('ds_id', pl.UInt32)])
-	return tok_pl.schema == validation
+	schema = OrderedDict([(col, pl.Categorical if col in TAG_COLUMNS and (dtype == pl.String or isinstance(dtype, pl.Enum)) else dtype) for col, dtype in tok_pl.schema.items() if col not in LEXICON_COLUMNS])
+	return schema == DS_TOKENS_SCHEMA
+
+def encode_tags_pl(tok_pl):
+	return tok_pl.with_columns(pl.col(TAG_COLUMNS).cast(pl.String).cast(pl.Categorical))
 
 def check_corpus_pl(tok_pl, check_size=False, check_ref=False, target_docs=None):
 	is_valid = check_schema(tok_pl)
@@ -266,78 +345,204 @@ def check_reference(ibis_conn):
 		ibis_conn.create_table()
 	return df, dup_docs
 
-def get_doc_cats(doc_ids):
-	if all(['_' in item for item in doc_ids]):
-		doc_cats = [re.sub(r"_\S+$", "", item, flags=re.UNICODE) for item in doc_ids]
-		if min([len(item) for item in doc_cats]) == 0:
-			doc_cats = []
-	else:
-		doc_cats = []
-	return doc_cats
+# Document table: one row per document, built once when a corpus is loaded from the tokens and the count store.
+# A document's category is the part of its doc_id before the first underscore (null when there is none);
+# doc_id is Categorical, as in the count store, so that selecting the documents of some categories is a join on integer codes.
+def doc_table_pl(tok_pl, pos_counts, ds_counts):
+	docs = (
+		tok_pl
+		.group_by("doc_id")
+		.agg(pl.col("token").str.len_bytes().sum().cast(pl.UInt32).alias("bytes"))
+		.with_columns(pl.col("doc_id").str.extract(r"^([^_]+)_.", 1).alias("category"))
+		.sort("doc_id")
+		.with_columns(pl.col("doc_id").cast(pl.Categorical))
+		.join(pos_counts.group_by("doc_id").agg(pl.col("AF").sum().alias("tokens_pos")), on="doc_id", how="left")
+		.join(ds_counts.group_by("doc_id").agg(pl.col("AF").sum().alias("tokens_ds")), on="doc_id", how="left")
+		.with_columns(pl.col(["tokens_pos", "tokens_ds"]).fill_null(0).cast(pl.UInt32))
+		.select(["doc_id", "category", "tokens_pos", "tokens_ds", "bytes"])
+	)
+	return(docs)
+
+# Categories of the documents in doc_id order, or an empty list unless every document has one.
+def get_doc_cats(docs):
+	if docs.get_column("category").null_count() > 0:
+		return([])
+	return(docs.get_column("category").to_list())
 
 def tokens_to_pl(tok):
-    data = [[k, *v] for k, lst in tok.items() for v in lst]
-    df = (
-        pl.DataFrame(data, schema =["doc_id", "token", "pos_tag", "ds_tag"], orient="row")
-        # assign unique ids to part-of-speech tags for grouping
-        .with_columns(
-            pl.when(
-                pl.col("pos_tag").str.contains("\d\d$") & pl.col("pos_tag").str.contains("[^1]$")
-            )
-            .then(None)
-            .otherwise(True)
-            .alias('pos_id')
-        )
-        .with_columns(
-            pl.when(
-                pl.col("pos_id") == True)
-            .then(pl.cum_sum("pos_id"))
-            .otherwise(None)
-            .forward_fill()
-        )
-        # ensure that ids and base tags are the same (e.g., II21, II22, etc. render as II)
-        .with_columns(
-            pl.when(
-                pl.col("pos_tag").str.contains("\d\d$") & pl.col("pos_tag").str.contains("[^1]$")
-            )
-            .then(None)
-            .otherwise(pl.col("pos_tag").str.replace("\d\d$", ""))
-            .forward_fill() 
-            .name.keep()
-        )
-        # assign unique ids to DocuScope tags for grouping
-        .with_columns(
-            pl.when(
-                pl.col("ds_tag").str.starts_with("B-") | pl.col("ds_tag").str.starts_with("O-")
-            )
-            .then(True)
-            .otherwise(False)
-            .alias('ds_id')
-        )
-        .with_columns(
-            pl.when(
-                pl.col("ds_id") == True
-            )
-            .then(pl.cum_sum("ds_id"))
-            .otherwise(None)
-            .forward_fill()
-        )
-        # ensure that ids and base tags are the same (e.g., B-ConfidenceHigh, I-ConfidenceHigh are rendered as ConfidenceHigh)
-        .with_columns(
-            pl.when(
-                pl.col("ds_tag").str.starts_with("B-") | pl.col("ds_tag").str.starts_with("O-")
-            )
-            .then(pl.col("ds_tag").str.strip_chars_start("B-"))
-            .otherwise(None)
-            .forward_fill()
-        )
-        .with_columns(
-            pl.when(
-                pl.col("ds_tag") == "O-"
-            )
-            .then(pl.col("ds_tag").str.replace("O-", "Untagged"))
-            .otherwise(pl.col("ds_tag"))
-        )
-    )
-    return(df)
+	data = [[k, *v] for k, lst in tok.items() for v in lst]
+	df = pl.DataFrame(data, schema=["doc_id", "token", "pos_tag", "ds_tag"], orient="row")
+	return(assign_ids_pl(df))
+
+# Assign pos_id / ds_id and base tags in one linear pass over the rows.
+# Whether a tag opens a new unit and what its base tag is gets decided once per distinct tag;
+# ids are then a running count of unit starts and base tags carry forward from the last start.
+# Rows before the first unit start are left null, just as a forward fill would leave them.
+def assign_ids_pl(df):
+	if df.height == 0:
+		return encode_tags_pl(df).with_columns(pl.lit(None, dtype=pl.UInt32).alias("pos_id"), pl.lit(None, dtype=pl.UInt32).alias("ds_id"))
+
+	pos = df.get_column("pos_tag").cast(pl.Categorical).cat.to_local()
+	pos_cats = pos.cat.get_categories().to_list()
+	pos_codes = pos.to_physical().to_numpy()
+	pos_starts = np.array([not (bool(re.search(r"\d\d$", tag)) and not tag.endswith("1")) for tag in pos_cats], dtype=bool)
+	pos_base = pl.Series([re.sub(r"\d\d$", "", tag, count=1) for tag in pos_cats], dtype=pl.Categorical)
+
+	ds = df.get_column("ds_tag").cast(pl.Categorical).cat.to_local()
+	ds_cats = ds.cat.get_categories().to_list()
+	ds_codes = ds.to_physical().to_numpy()
+	ds_starts = np.array([tag.startswith("B-") or tag.startswith("O-") for tag in ds_cats], dtype=bool)
+	ds_base = pl.Series(["Untagged" if tag == "O-" else tag.lstrip("B-") for tag in ds_cats], dtype=pl.Categorical)
+
+	def unit_columns(codes, starts, base):
+		is_start = starts[codes]
+		unit_id = np.cumsum(is_start, dtype=np.int64)
+		last_start = np.maximum.accumulate(np.where(is_start, np.arange(len(codes)), -1))
+		unit_tag = base.gather(pl.Series(codes[np.maximum(last_start, 0)], dtype=pl.UInt32))
+		has_unit = pl.Series(last_start >= 0, dtype=pl.Boolean)
+		return unit_id, unit_tag, has_unit
+
+	pos_id, pos_tag, has_pos = unit_columns(pos_codes, pos_starts, pos_base)
+	ds_id, ds_tag, has_ds = unit_columns(ds_codes, ds_starts, ds_base)
+
+	df = (
+		df
+		.with_columns(
+			pl.when(has_pos).then(pos_tag).alias("pos_tag"),
+			pl.when(has_ds).then(ds_tag).alias("ds_tag"),
+			pl.when(has_pos).then(pl.Series(pos_id)).cast(pl.UInt32).alias("pos_id"),
+			pl.when(has_ds).then(pl.Series(ds_id)).cast(pl.UInt32).alias("ds_id")
+		)
+	)
+	return(df)
+
+# Stack per-document tables whose ids each start at 1, shifting ids so they stay unique across the corpus.
+# A table that opens mid-unit continues the last unit of the table before it.
+def stack_docs_pl(frames):
+	stacked = []
+	pos_last = (0, None)
+	ds_last = (0, None)
+	for df in frames:
+		if df.height == 0:
+			continue
+		df = df.with_columns(
+			pl.col("pos_id").add(pos_last[0]).cast(pl.UInt32),
+			pl.col("ds_id").add(ds_last[0]).cast(pl.UInt32)
+		)
+		if df.item(0, "pos_id") is None and pos_last[1] is not None:
+			df = df.with_columns(pl.col("pos_id").fill_null(pos_last[0]), pl.col("pos_tag").fill_null(pos_last[1]))
+		if df.item(0, "ds_id") is None and ds_last[1] is not None:
+			df = df.with_columns(pl.col("ds_id").fill_null(ds_last[0]), pl.col("ds_tag").fill_null(ds_last[1]))
+		pos_last = (df.item(-1, "pos_id"), df.item(-1, "pos_tag"))
+		ds_last = (df.item(-1, "ds_id"), df.item(-1, "ds_tag"))
+		stacked.append(df)
+	if len(stacked) == 0:
+		return pl.DataFrame(schema=DS_TOKENS_SCHEMA)
+	return pl.concat(stacked)
+
+# Vocabulary encoding, done once when a corpus is loaded.
+# Each POS and DocuScope unit is reduced to its normalized form (its tokens joined, lowercased and stripped of whitespace),
+# and each distinct form gets a UInt32 id, shared by both tagsets. The ids are kept on the token rows as pos_lex / ds_lex,
+# and the forms in a lexicon table in which a form's row index is its id.
+# Ids follow the sort order of the forms, so an exact form or all forms that share a prefix can be found by binary search.
+# Counting and joining can then run on the ids, with forms looked up only for display.
+def encode_lexicon_pl(tok_pl):
+	tok_pl = tok_pl.select(DS_TOKENS_SCHEMA.keys())
+	forms = tok_pl.select(
+		pl.col("token").str.concat("").over(["doc_id", "pos_id"]).str.to_lowercase().str.strip_chars().alias("pos_form"),
+		pl.col("token").str.concat("").over(["doc_id", "ds_id"]).str.to_lowercase().str.strip_chars().alias("ds_form")
+	)
+	codes = pl.concat([forms.get_column("pos_form"), forms.get_column("ds_form")]).cast(pl.Categorical).cat.to_local()
+	forms = codes.cat.get_categories()
+	rank = np.empty(len(forms), dtype=np.uint32)
+	rank[forms.arg_sort().to_numpy()] = np.arange(len(forms), dtype=np.uint32)
+	lexicon = pl.DataFrame({"form": forms.sort()}).with_row_index("lex_id")
+	codes = pl.Series(rank[codes.to_physical().to_numpy()], dtype=pl.UInt32)
+	tok_pl = tok_pl.with_columns(
+		codes.slice(0, tok_pl.height).alias("pos_lex"),
+		codes.slice(tok_pl.height).alias("ds_lex")
+	)
+	return(tok_pl, lexicon)
+
+# Unit tables: one row per POS or DocuScope unit, with its tokens joined and its lexicon id.
+# They are built once when a corpus is loaded and kept in the corpus store, so analyses start from units
+# rather than regrouping the token rows on every call.
+def unit_tables_pl(tok_pl):
+	pos_units = (
+		tok_pl
+		.group_by(["doc_id", "pos_id", "pos_tag"], maintain_order = True)
+		.agg(pl.col("token").str.concat(""), pl.col("pos_lex").first())
+	)
+	ds_units = (
+		tok_pl
+		.group_by(["doc_id", "ds_id", "ds_tag"], maintain_order = True)
+		.agg(pl.col("token").str.concat(""), pl.col("ds_lex").first())
+	)
+	return(pos_units, ds_units)
+
+# Positional indexes, built once when a corpus is loaded alongside the unit tables.
+# An index has one row per unit, ordered by lexicon id and then by position, where a unit's position is its row in the unit table;
+# the units with a given id are a contiguous run of rows, found by binary search on lex_id.
+# The suffix table holds the lexicon's forms reversed and sorted, so that forms sharing an ending are also a contiguous run.
+def index_pl(unit_pl, lex_col):
+	index = (
+		unit_pl
+		.select(pl.col(lex_col).alias("lex_id"), pl.int_range(pl.len(), dtype=pl.UInt32).alias("position"))
+		.sort("lex_id", maintain_order=True)
+	)
+	return(index)
+
+def suffixes_pl(lexicon):
+	return(lexicon.select(pl.col("form").str.reverse().alias("suffix"), "lex_id").sort("suffix"))
+
+def index_tables_pl(pos_units, ds_units, lexicon):
+	return(index_pl(pos_units, "pos_lex"), index_pl(ds_units, "ds_lex"), suffixes_pl(lexicon))
+
+# Sequences: the positions, in ascending order, of the units that collocations and n-grams are read over.
+# Collocation spans count units with a letter in their form; n-grams skip punctuation, as the frequency tables do.
+# They are stored with the corpus, so that a query only looks up its hits in them rather than filtering the unit table.
+def sequence_tables_pl(pos_units, ds_units, lexicon):
+	alpha_ids = _analysis.lexicon_ids(lexicon, pl.col("form").str.contains("[a-z]"))
+	punct_ids = _analysis.lexicon_ids(lexicon, pl.col("form").str.contains("^[[[:punct:]] ]+$"))
+	def positions(unit_pl, expr):
+		return(unit_pl.select(pl.arg_where(expr).cast(pl.UInt32)).to_series())
+	pos_alpha_seq = positions(pos_units, pl.col("pos_lex").is_in(alpha_ids))
+	ds_alpha_seq = positions(ds_units, pl.col("ds_lex").is_in(alpha_ids))
+	pos_word_seq = positions(pos_units, pl.col("pos_tag") != "Y")
+	ds_word_seq = positions(ds_units, ~(pl.col("ds_lex").is_in(punct_ids) & (pl.col("ds_tag") == "Untagged")))
+	return(pos_alpha_seq, ds_alpha_seq, pos_word_seq, ds_word_seq)
 
+# The corpus store: every table kept for a loaded corpus, built from its tokens in one place and returned by name.
+def build_corpus_store(tok_pl):
+	ds_tokens, lexicon = encode_lexicon_pl(tok_pl)
+	pos_units, ds_units = unit_tables_pl(ds_tokens)
+	pos_index, ds_index, suffixes = index_tables_pl(pos_units, ds_units, lexicon)
+	pos_alpha_seq, ds_alpha_seq, pos_word_seq, ds_word_seq = sequence_tables_pl(pos_units, ds_units, lexicon)
+	pos_counts, ds_counts = _analysis.count_tables_pl(pos_units, ds_units, lexicon)
+	docs = doc_table_pl(ds_tokens, pos_counts, ds_counts)
+	ft_pos, ft_ds = _analysis.frequency_counts_pl(pos_counts, ds_counts, lexicon)
+	tt_pos, tt_ds = _analysis.tag_counts_pl(pos_counts, ds_counts)
+	dtm_pos, dtm_ds = _analysis.dtm_pl(pos_units, ds_units, lexicon)
+	corpus_store = {
+		"ds_tokens": ds_tokens,
+		"lexicon": lexicon,
+		"pos_units": pos_units,
+		"ds_units": ds_units,
+		"pos_index": pos_index,
+		"ds_index": ds_index,
+		"suffixes": suffixes,
+		"pos_alpha_seq": pos_alpha_seq,
+		"ds_alpha_seq": ds_alpha_seq,
+		"pos_word_seq": pos_word_seq,
+		"ds_word_seq": ds_word_seq,
+		"pos_counts": pos_counts,
+		"ds_counts": ds_counts,
+		"docs": docs,
+		"dtm_ds": dtm_ds,
+		"dtm_pos": dtm_pos,
+		"ft_ds": ft_ds,
+		"ft_pos": ft_pos,
+		"tt_ds": tt_ds,
+		"tt_pos": tt_pos
+		}
+	return(corpus_store)
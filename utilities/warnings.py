@@ -180,3 +180,15 @@ warning_22 = """
 	&#8597; You must select at least one category as your target and one as your reference.
 	</div>
 	"""
+
+warning_23 = """
+	<div style="background-color: #fddfd7; padding-left: 5px;">
+	&#128301; Your search pattern isn't a valid regular expression. Check it and try again.
+	</div>
+	"""
+
+warning_24 = """
+	<div style="background-color: #fddfd7; padding-left: 5px;">
+	&#8597; Your corpus needs at least two document categories to compare them.
+	</div>
+	"""